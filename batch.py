@@ -0,0 +1,359 @@
+#!/usr/bin/python3
+
+"""
+batch.py
+
+Command-line batch mode: streams arena matchups from a CSV or JSONL file, solves them on a pool of worker
+processes and streams the results back out in input order.
+
+Each input row has the fields game, followup, hit1, hit2, dmg1, dmg2, crit1, crit2, hp1 and hp2, where 1 is
+the player and 2 is the enemy (the same fields the GUI reads). Blank or missing hit and crit fields default
+to 100 and 0, as in the GUI, and a missing followup defaults to "Neither". Each output row repeats the
+input fields and adds numerator, denominator, percent and error; invalid rows get an error message instead
+of a result.
+
+With --tolerance, each row is answered in float64 (percent only) when solver.floatErrorBound() certifies the
+result to within the tolerance, and exactly otherwise. The output then has a path column saying which one
+answered, and the number of rows each path answered is printed to stderr at the end.
+
+With --result-cache, exact results are looked up in (and added to) the persistent cache of resultcache.py,
+which GUI sessions and other batch runs share.
+
+Usage: python batch.py matchups.csv -o results.csv [--processes N] [--chunk-size N] [--backend float]
+                       [--tolerance 1e-9] [--result-cache [PATH]] [--instrument records.jsonl]
+                       [--profile table%d.prof]
+"""
+
+import argparse
+import csv
+import json
+import sys
+from collections import deque
+from fractions import Fraction
+from multiprocessing import Pool, cpu_count
+
+from solver import BattleTable, Instrument, InputError, TableCache, backends, floatErrorBound, floatKernel, \
+                   hitsToKill, recordWriter, setInstrument, trueHit, validateBattle
+
+
+inputFields = ["game", "followup", "hit1", "hit2", "dmg1", "dmg2", "crit1", "crit2", "hp1", "hp2"]
+outputFields = inputFields + ["numerator", "denominator", "percent", "error"]
+
+# Values used for blank optional fields, matching the GUI
+defaults = {"followup": "Neither", "hit1": 100, "hit2": 100, "crit1": 0, "crit2": 0}
+
+# Rows with the same rates share a table only while it has at most this many times the cells their own
+# tables would have together; e.g. (200, 2) and (2, 200) are solved from two thin tables, not one 200x200
+SPLIT_RATIO = 4
+
+
+###############################################################################
+################################ Input/output #################################
+###############################################################################
+
+class MalformedRow(object):
+    """ Stands in for a JSONL line that isn't valid JSON; parseRow() turns it into an InputError, so the line
+        gets an error row in the output like any other invalid row. """
+    def __init__(self, number, message):
+        self.number = number
+        self.message = message
+
+def readRows(stream, fmt):
+    """ Yields the matchups in the stream one at a time as dicts, or as MalformedRows for JSONL lines that
+        can't be parsed. """
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield MalformedRow(number, str(e))
+
+def parseRow(row):
+    """ Converts a raw input row into solveBattle() arguments. Raises InputError for rows that aren't
+        objects, and for missing or non-integer fields. """
+    if isinstance(row, MalformedRow):
+        raise InputError("Input error", "Line %d is not valid JSON: %s" % (row.number, row.message))
+    if not isinstance(row, dict):
+        raise InputError("Input error", "Each row must be an object with named fields.")
+    values = {}
+    missing, notInt = [], []
+    for field in inputFields:
+        value = row.get(field)
+        if value is None or value == "":
+            if field in defaults:
+                value = defaults[field]
+            else:
+                missing += [field]
+                continue
+        if field in ("game", "followup"):
+            values[field] = value
+            continue
+        try:
+            values[field] = int(value)
+            if str(values[field]) != str(value).strip():
+                notInt += [field]
+        except (TypeError, ValueError):
+            notInt += [field]
+    if len(missing) > 0:
+        raise InputError("Input error", "Mandatory field(s) missing: " + ", ".join(missing))
+    if len(notInt) > 0:
+        raise InputError("Input error", "Fields must have whole number values: " + ", ".join(notInt))
+
+    return (values["game"], (values["hit1"], values["hit2"]), (values["dmg1"], values["dmg2"]), \
+            (values["crit1"], values["crit2"]), (values["hp1"], values["hp2"]), values["followup"])
+
+def writeRows(stream, fmt, fields=outputFields):
+    """ Returns a function that writes one output row to the stream. """
+    if fmt == "csv":
+        writer = csv.DictWriter(stream, fields, extrasaction="ignore")
+        writer.writeheader()
+        return writer.writerow
+    return lambda row: stream.write(json.dumps(row) + "\n")
+
+def formatOf(path, fmt):
+    """ The format given on the command line, or else the one implied by the file extension. """
+    if fmt is not None:
+        return fmt
+    return "jsonl" if path.endswith(".jsonl") or path.endswith(".json") else "csv"
+
+
+###############################################################################
+################################ Worker side ##################################
+###############################################################################
+
+# Each worker process keeps its own cache, so tables are reused across the chunks it receives, and its own
+# connection to the persistent result cache, if one is used
+_cache = None
+_results = None
+
+def _initWorker(maxBytes, instrument=None, resultCache=None):
+    """ Sets up a worker's cache, its instrumentation if instrument gives (record target, profile path), and
+        its persistent result cache if resultCache gives (path, size limit in bytes). """
+    global _cache, _results
+    _cache = TableCache(maxBytes)
+    if instrument is not None:
+        setInstrument(Instrument(recordWriter(instrument[0]), instrument[1]))
+    if resultCache is not None:
+        from resultcache import ResultCache
+        _results = ResultCache(resultCache[0] or None, resultCache[1])
+
+def solveChunk(rows, backend="exact", tolerance=None):
+    """ Solves a chunk of raw input rows and returns (numerator, denominator, percent, error) tuples in the
+        same order. Rows that share a follow-up setting and true hit/crit rates are solved from one table,
+        sized for the largest matchups in the group, unless that table would be mostly unused (see
+        splitGroup()). If tolerance is given, backend is ignored: rows whose
+        float result is certified to within tolerance are solved from a float table and the rest from an
+        integer table, and each tuple gets a fifth field, the path ("float" or "exact") that answered. """
+    global _cache
+    if _cache is None:
+        _cache = TableCache()
+
+    results = [None] * len(rows)
+    groups = {}
+    for index, row in enumerate(rows):
+        try:
+            game, hit, dmg, crit, hp, followup = parseRow(row)
+            validateBattle(game, hit, dmg, crit, hp, followup)
+        except InputError as e:
+            results[index] = ("", "", "", e.message)
+            continue
+
+        # If either side can't hit/damage the other, the battle needs no table
+        if hit[0] == 0 or dmg[0] == 0:
+            results[index] = (0, 1, 0.0, "", "exact")[:5 if tolerance is not None else 4]
+            continue
+        if hit[1] == 0 or dmg[1] == 0:
+            results[index] = (1, 1, 100.0, "", "exact")[:5 if tolerance is not None else 4]
+            continue
+
+        key = (followup, trueHit(game, hit[0]), trueHit(game, hit[1]), Fraction(crit[0], 100), \
+               Fraction(crit[1], 100))
+        m, n = hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0])
+        groups.setdefault(key, []).append((index, m, n))
+
+    for (followup, p1, p2, c1, c2), members in groups.items():
+        if tolerance is None:
+            solveGroup(results, members, followup, p1, p2, c1, c2, backend)
+            continue
+        terms = floatKernel(followup, p1, p2, c1, c2)
+        certified = [member for member in members if floatErrorBound(terms, member[1], member[2]) <= tolerance]
+        rest = [member for member in members if member not in certified]
+        solveGroup(results, certified, followup, p1, p2, c1, c2, "float", "float")
+        solveGroup(results, rest, followup, p1, p2, c1, c2, "integer", "exact")
+
+    return results
+
+def solveGroup(results, members, followup, p1, p2, c1, c2, backend, path=None):
+    """ Fills in the results of a group of (index, m, n) matchups from one table. If path is given, it is
+        added to each result. Exact results are taken from the persistent result cache when it has them, and
+        the others are added to it. """
+    known = {}
+    if _results is not None and backend != "float":
+        from resultcache import canonicalKey
+        keys = dict((member, canonicalKey(followup, member[1], member[2], p1, p2, c1, c2)) for member in members)
+        for member in members:
+            victory = _results.get(keys[member])
+            if victory is not None:
+                known[member] = victory
+    solved = [member for member in members if member not in known]
+    if solved:
+        for part in splitGroup(solved):
+            m = max(member[1] for member in part)
+            n = max(member[2] for member in part)
+            table = groupTable(followup, m, n, p1, p2, c1, c2, backend)
+            for member in part:
+                known[member] = table.cell(member[1], member[2])
+        if _results is not None and backend != "float":
+            _results.putMany([(keys[member], known[member]) for member in solved])
+
+    for member in members:
+        victory = known[member]
+        if backend == "float":
+            results[member[0]] = ("", "", 100 * victory, "")
+        else:
+            results[member[0]] = (victory.numerator, victory.denominator, float(100 * victory), "")
+        if path is not None:
+            results[member[0]] += (path,)
+
+
+def cells(m, n):
+    return (m + 1) * (n + 1)
+
+def splitGroup(members):
+    """ Splits a group of (index, m, n) matchups into parts that are each solved from one table, such that a
+        part's table has at most SPLIT_RATIO times the cells of its matchups' own tables together. """
+    parts = []
+    for member in sorted(members, key=lambda member: (member[1], member[2]), reverse=True):
+        own = cells(member[1], member[2])
+        for part in parts:
+            m, n = max(part[0], member[1]), max(part[1], member[2])
+            if cells(m, n) <= SPLIT_RATIO * (part[2] + own):
+                part[:3] = [m, n, part[2] + own]
+                part[3].append(member)
+                break
+        else:
+            parts.append([member[1], member[2], own, [member]])
+    return [part[3] for part in parts]
+
+def groupTable(followup, m, n, p1, p2, c1, c2, backend):
+    """ A table covering (m, n) from the worker's cache. A cached table that is too small is extended, unless
+        covering both would be mostly unused; then a table for (m, n) alone is solved and replaces it. """
+    table = _cache.find(followup, p1, p2, c1, c2, backend)
+    if table is not None and (table.m < m or table.n < n) and \
+       cells(max(m, table.m), max(n, table.n)) > SPLIT_RATIO * (cells(table.m, table.n) + cells(m, n)):
+        table = BattleTable(followup, m, n, p1, p2, c1, c2, backend)
+        _cache.add(table)
+        return table
+    return _cache.get(followup, m, n, p1, p2, c1, c2, backend)
+
+
+###############################################################################
+################################ Driver side ##################################
+###############################################################################
+
+def chunked(rows, size):
+    """ Groups an iterable of rows into lists of at most size rows, without reading ahead further. """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def solveStream(rows, processes=None, chunkSize=1000, backend="exact", maxBytes=64 * 2**20, instrument=None, \
+                tolerance=None, resultCache=None):
+    """ Yields (row, result) pairs for an iterable of raw input rows, in input order. Chunks of rows are
+        solved on a pool of worker processes (or in this process if processes is 1). At most a few chunks per
+        process are in flight at once, so the input is never read far ahead of the output. If instrument is
+        given as (record target, profile path), every table solved is instrumented (see solver.Instrument).
+        tolerance works as in solveChunk(), and resultCache as in _initWorker(). """
+    processes = processes or cpu_count()
+    if processes == 1:
+        _initWorker(maxBytes, instrument, resultCache)
+        for chunk in chunked(rows, chunkSize):
+            for row, result in zip(chunk, solveChunk(chunk, backend, tolerance)):
+                yield row, result
+        return
+
+    pool = Pool(processes, _initWorker, (maxBytes, instrument, resultCache))
+    try:
+        pending = deque()
+        for chunk in chunked(rows, chunkSize):
+            pending.append((chunk, pool.apply_async(solveChunk, (chunk, backend, tolerance))))
+            if len(pending) >= 2 * processes:
+                chunk, result = pending.popleft()
+                for pair in zip(chunk, result.get()):
+                    yield pair
+        while pending:
+            chunk, result = pending.popleft()
+            for pair in zip(chunk, result.get()):
+                yield pair
+    finally:
+        pool.terminate()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve Fire Emblem arena matchups in bulk.")
+    parser.add_argument("input", help='CSV or JSONL file of matchups ("-" for stdin)')
+    parser.add_argument("-o", "--output", default="-", help='file for the results (default "-", stdout)')
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="default: from the file extension")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="matchups sent to a worker at a time")
+    parser.add_argument("--backend", choices=backends, default="exact",
+                        help='"float" gives the percent only, without numerator/denominator')
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="answer rows in float64 when certified to within this absolute error in the "
+                             "probability, and exactly otherwise; adds a path column (ignores --backend)")
+    parser.add_argument("--cache-mb", type=float, default=64, help="table cache size per worker, in MB")
+    parser.add_argument("--result-cache", nargs="?", const="", default=None, metavar="PATH",
+                        help="use the persistent result cache (default path: see resultcache.py) for exact results")
+    parser.add_argument("--result-cache-mb", type=float, default=256, help="persistent result cache size, in MB")
+    parser.add_argument("--instrument", metavar="TARGET",
+                        help='write a JSON record for every table solved to TARGET ("stderr" or a file)')
+    parser.add_argument("--profile", metavar="PATH",
+                        help='dump cProfile stats of every table solved to PATH ("%%d" numbers the tables); '
+                             'implies --processes 1')
+    args = parser.parse_args(argv)
+
+    instrument = None
+    if args.instrument or args.profile:
+        instrument = (args.instrument or "stderr", args.profile)
+    if args.profile:
+        args.processes = 1
+
+    fields = outputFields + (["path"] if args.tolerance is not None else [])
+    paths = {}
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", newline="")
+    try:
+        write = writeRows(sink, formatOf(args.output, args.output_format), fields)
+        rows = readRows(source, formatOf(args.input, args.input_format))
+        resultCache = None
+        if args.result_cache is not None:
+            resultCache = (args.result_cache, int(args.result_cache_mb * 2**20))
+        for row, result in solveStream(rows, args.processes, args.chunk_size, args.backend, \
+                                       int(args.cache_mb * 2**20), instrument, args.tolerance, resultCache):
+            # Rows that aren't objects are echoed with empty input fields, next to their error
+            out = dict((field, row.get(field, "") if isinstance(row, dict) else "") for field in inputFields)
+            out.update(zip(fields[len(inputFields):], result))
+            write(out)
+            if len(result) > 4:
+                paths[result[4]] = paths.get(result[4], 0) + 1
+        if args.tolerance is not None:
+            total = sum(paths.values())
+            sys.stderr.write("float path answered %d of %d rows (%.1f%%), exact path %d\n" % (paths.get("float", 0), \
+                             total, 100.0 * paths.get("float", 0) / total if total else 0.0, paths.get("exact", 0)))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/python3
+
+"""
+benchmark.py
+
+Reproducible benchmark of the dynamic programs. Times DP_1_1, DP_1_2 and DP_2_1 on square tables of
+several sizes, for each true hit family (1RN, 2RN, Fates), with and without crits, for each backend, and
+both filling the whole table (mode "table") and keeping only a rolling window of it (mode "window").
+Each case records the wall time (best of several runs), the peak memory allocated during one run, and the
+bit length of the result's denominator. Results are written as JSON so runs from different commits can be
+compared, and --compare exits with status 1 if any case got slower than the threshold allows.
+
+--check runs a correctness cross-check instead of timing anything: on random small tables it compares
+DP_round, DP_integer and DP_window (and DP_float, within floatErrorBound()) against the original Fraction
+dynamic programs DP_1_1, DP_2_1 and DP_1_2, both solving from scratch and extending a smaller table, and
+exits with status 1 on any mismatch. Run it after changing any of the dynamic programs or their kernels.
+
+Usage: python benchmark.py -o bench.json [--sizes 5,10,25,50,100,200,400] [--backends exact,integer,float]
+                           [--modes table,window]
+       python benchmark.py -o new.json --compare old.json [--threshold 1.25]
+       python benchmark.py --check [--cases 200] [--seed 1]
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from fractions import Fraction
+
+from solver import BattleTable, DP_float, DP_functions, DP_integer, DP_round, DP_window, _1RN_games, _2RN_games, \
+                   floatErrorBound, floatKernel, gameList, np, trueHit
+
+
+# Displayed rates used for every case: a typical arena matchup, with and without crits
+HIT = (75, 60)
+CRITS = {"zero": (0, 0), "nonzero": (15, 8)}
+FAMILIES = {"1RN": _1RN_games[0], "2RN": _2RN_games[0], "Fates": "Fates"}
+FUNCTIONS = {"DP_1_1": "Neither", "DP_2_1": "Player", "DP_1_2": "Enemy"}
+
+# Largest table size run by default for each backend; the Fraction path takes minutes beyond 100x100
+MAX_SIZE = {"exact": 100, "integer": 400, "float": 1000}
+
+
+###############################################################################
+################################# Measuring ###################################
+###############################################################################
+
+def solverFor(function, backend, mode="table"):
+    """ The function that solves one case for the given DP function, backend and mode. """
+    followup = FUNCTIONS[function]
+    if mode == "window":
+        return lambda m, n, p1, p2, c1, c2: DP_window(followup, m, n, p1, p2, c1, c2, backend)
+    if backend == "float":
+        return lambda m, n, p1, p2, c1, c2: DP_float(followup, m, n, p1, p2, c1, c2)
+    elif backend == "integer":
+        return lambda m, n, p1, p2, c1, c2: DP_integer(followup, m, n, p1, p2, c1, c2)
+    return DP_functions[followup]
+
+def runCase(function, backend, family, crit, size, mode="table", minTime=0.2, maxRepeats=20):
+    """ Benchmarks one case and returns its record. The case is repeated until minTime seconds have been
+        spent (at most maxRepeats times) and the best time is kept; peak memory is measured in a separate
+        run, since tracing allocations slows the solve down. """
+    game = FAMILIES[family]
+    args = (size, size, trueHit(game, HIT[0]), trueHit(game, HIT[1]), \
+            Fraction(CRITS[crit][0], 100), Fraction(CRITS[crit][1], 100))
+    solve = solverFor(function, backend, mode)
+
+    # Garbage collection passes land on different runs each time, so they are kept out of the timings
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        while len(times) < maxRepeats and sum(times) < minTime:
+            start = time.perf_counter()
+            result = solve(*args)
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    solve(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {"function": function, "backend": backend, "mode": mode, "family": family, "crit": crit, \
+            "m": size, "n": size,
+            "seconds": min(times), "repeats": len(times), "peakBytes": peak,
+            "denominatorBits": result.denominator.bit_length() if isinstance(result, Fraction) else None,
+            "result": float(result)}
+
+def runSuite(sizes, backends, families=sorted(FAMILIES), crits=sorted(CRITS), functions=sorted(FUNCTIONS), \
+             maxSize=MAX_SIZE, modes=("table",), log=None, rounds=1):
+    """ Runs every case in the grid and returns the list of records. With several rounds, the whole grid is
+        run that many times and each case keeps its best time: repeats spread out over the run are far less
+        affected by a burst of load on the machine than repeats run back to back. """
+    records = []
+    for number in range(rounds):
+        index = 0
+        for backend in backends:
+            for size in sizes:
+                if size > maxSize.get(backend, size):
+                    continue
+                for mode in modes:
+                    for function in functions:
+                        for family in families:
+                            for crit in crits:
+                                record = runCase(function, backend, family, crit, size, mode)
+                                if number == 0:
+                                    records.append(record)
+                                else:
+                                    best = records[index]
+                                    best["repeats"] += record["repeats"]
+                                    best["seconds"] = min(best["seconds"], record["seconds"])
+                                    best["peakBytes"] = max(best["peakBytes"], record["peakBytes"])
+                                index += 1
+                                if log is not None:
+                                    log("%-7s %-6s %-7s %-5s crit=%-7s %4dx%-4d %10.4f s %12d B" % (backend, \
+                                        mode, function, family, crit, size, size, record["seconds"], \
+                                        record["peakBytes"]))
+    return records
+
+def environment():
+    """ Machine and source information stored alongside the results. """
+    try:
+        # The commit of this checkout, wherever the script is run from
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT, \
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "numpy": np.__version__ if np is not None else None}
+
+
+###############################################################################
+################################# Comparing ###################################
+###############################################################################
+
+def caseKey(record):
+    # Runs from before modes were added only have the table mode
+    return (record["function"], record["backend"], record.get("mode", "table"), record["family"], record["crit"], \
+            record["m"], record["n"])
+
+def compare(old, new, threshold=1.25, floor=0.02):
+    """ Returns the cases in new that are more than threshold times slower than in old. Cases faster than
+        floor seconds in both runs are skipped, since their timings are mostly noise. """
+    before = dict((caseKey(record), record) for record in old)
+    regressions = []
+    for record in new:
+        previous = before.get(caseKey(record))
+        if previous is None or max(previous["seconds"], record["seconds"]) < floor:
+            continue
+        ratio = record["seconds"] / previous["seconds"]
+        if ratio > threshold:
+            regressions.append((record, previous, ratio))
+    return regressions
+
+
+###############################################################################
+############################## Cross-checking #################################
+###############################################################################
+
+def checkCase(followup, m, n, p1, p2, c1, c2, m0, n0):
+    """ Compares every dynamic program against the Fraction reference for one case, solving (m, n) from
+        scratch and by extending an (m0, n0) table. Returns a list of descriptions of the mismatches. """
+    rates = (p1, p2, c1, c2)
+    reference = DP_functions[followup](m, n, *rates, full=True)
+    part = DP_functions[followup](m0, n0, *rates, full=True)
+    solves = [("DP_round", DP_round(followup, m, n, *rates, full=True)),
+              ("DP_round extended", DP_round(followup, m, n, *rates, full=True, table=part)),
+              ("DP_integer", DP_integer(followup, m, n, *rates, full=True)),
+              ("DP_integer extended", DP_integer(followup, m, n, *rates, full=True, table=part)),
+              ("DP_functions extended", DP_functions[followup](m, n, *rates, full=True, table=part))]
+    # BattleTable keeps integer tables in scaled form and converts cells as they are read
+    integer = BattleTable(followup, m0, n0, *rates, backend="integer")
+    for name, table in [("BattleTable integer", BattleTable(followup, m, n, *rates, backend="integer")),
+                        ("BattleTable integer extended", integer.extended(m, n))]:
+        solves.append((name, [[table.cell(i, j) for j in range(n + 1)] for i in range(m + 1)]))
+    mismatches = []
+    for name, table in solves:
+        if table != reference:
+            mismatches.append(name)
+    for backend in ("exact", "integer"):
+        if DP_window(followup, m, n, *rates, backend=backend) != reference[m][n]:
+            mismatches.append("DP_window " + backend)
+
+    if np is not None:
+        terms = floatKernel(followup, *rates)
+        tables = [("DP_float", DP_float(followup, m, n, *rates, full=True)),
+                  ("DP_float extended", DP_float(followup, m, n, *rates, full=True, \
+                                                 table=DP_float(followup, m0, n0, *rates, full=True)))]
+        for name, table in tables:
+            if any(abs(float(table[i][j]) - float(reference[i][j])) > floatErrorBound(terms, i, j) \
+                   for i in range(m + 1) for j in range(n + 1)):
+                mismatches.append(name)
+        if abs(DP_window(followup, m, n, *rates, backend="float") - float(reference[m][n])) > \
+           floatErrorBound(terms, m, n):
+            mismatches.append("DP_window float")
+    return mismatches
+
+def crossCheck(cases=200, seed=1, maxSize=12, log=None):
+    """ Runs checkCase() on random cases: random games, follow-up settings, Hit 1-100 and Crit 0-100 (with
+        extra weight on 0 and 100), and tables up to maxSize on each side. Returns the number of failed
+        cases. """
+    rng = random.Random(seed)
+    crit = lambda: rng.choice([0, 100, rng.randint(0, 100)])
+    failures = 0
+    for case in range(cases):
+        game, followup = rng.choice(gameList), rng.choice(sorted(DP_functions))
+        hit = (rng.randint(1, 100), rng.randint(1, 100))
+        rates = (trueHit(game, hit[0]), trueHit(game, hit[1]), Fraction(crit(), 100), Fraction(crit(), 100))
+        m, n = rng.randint(1, maxSize), rng.randint(1, maxSize)
+        m0, n0 = rng.randint(1, m), rng.randint(1, n)
+        mismatches = checkCase(followup, m, n, *(rates + (m0, n0)))
+        if mismatches:
+            failures += 1
+            if log is not None:
+                log("MISMATCH %s %s hit=%s %dx%d (extending %dx%d), rates %s: %s" % (game, followup, hit, m, n, \
+                    m0, n0, ", ".join(str(x) for x in rates), ", ".join(mismatches)))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the arena dynamic programs.")
+    parser.add_argument("-o", "--output", default="-", help='JSON file for the results (default "-", stdout)')
+    parser.add_argument("--sizes", default="5,10,25,50,100,200,400", help="comma-separated table sizes")
+    parser.add_argument("--backends", default="exact,integer" + (",float" if np is not None else ""))
+    parser.add_argument("--families", default=",".join(sorted(FAMILIES)))
+    parser.add_argument("--modes", default="table,window", help='"table" (whole table) and/or "window"')
+    parser.add_argument("--max-size", action="append", default=[], metavar="BACKEND=SIZE",
+                        help="override the largest size run for a backend, e.g. exact=200")
+    parser.add_argument("--compare", metavar="OLD_JSON", help="fail if slower than this earlier run")
+    parser.add_argument("--threshold", type=float, default=1.25, help="allowed slowdown ratio (default 1.25)")
+    parser.add_argument("--rounds", type=int, default=5,
+                        help="run the whole grid this many times and keep each case's best time (default 5)")
+    parser.add_argument("--floor", type=float, default=0.02,
+                        help="skip cases faster than this many seconds in both runs (default 0.02)")
+    parser.add_argument("--check", action="store_true", help="cross-check the dynamic programs instead")
+    parser.add_argument("--cases", type=int, default=200, help="random cases for --check (default 200)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for --check (default 1)")
+    args = parser.parse_args(argv)
+
+    log = lambda line: sys.stderr.write(line + "\n")
+    if args.check:
+        failures = crossCheck(args.cases, args.seed, log=log)
+        if failures:
+            log("%d of %d cases failed" % (failures, args.cases))
+            sys.exit(1)
+        log("All %d cases agree" % args.cases)
+        return
+
+    maxSize = dict(MAX_SIZE)
+    for item in args.max_size:
+        backend, _, size = item.partition("=")
+        maxSize[backend] = int(size)
+
+    records = runSuite([int(x) for x in args.sizes.split(",")], args.backends.split(","), \
+                       args.families.split(","), maxSize=maxSize, modes=args.modes.split(","), log=log, \
+                       rounds=args.rounds)
+    report = {"version": 1, "environment": environment(), "results": records}
+    text = json.dumps(report, indent=1, sort_keys=True)
+    if args.output == "-":
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)["results"]
+        regressions = compare(old, records, args.threshold, args.floor)
+        for record, previous, ratio in regressions:
+            log("REGRESSION %s: %.4f s -> %.4f s (%.2fx)" % ("/".join(str(x) for x in caseKey(record)), \
+                previous["seconds"], record["seconds"], ratio))
+        if regressions:
+            sys.exit(1)
+        log("No regressions beyond %.2fx against %s" % (args.threshold, args.compare))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+
+"""
+loadtest.py
+
+Load test for server.py. Opens a number of keep-alive connections and sends random /solve requests over them
+as fast as the server answers, then reports the client-side latency percentiles and throughput followed by
+the server's own /metrics. The requests are drawn from a small pool of rates, so many of them share tables
+and exercise the server's cache and request coalescing. Requires Python 3.7+.
+
+Usage: python loadtest.py [--host 127.0.0.1] [--port 8080] [-n 1000] [-c 16] [--rates 8] [--max-hp 60]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from solver import gameList
+
+
+async def request(reader, writer, host, method, path, body=None):
+    """ Sends one request on an open connection and returns (status, response body). """
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(("%s %s HTTP/1.1\r\nHost: %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" \
+                  % (method, path, host, len(data))).encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def makeRequests(count, rates, maxHP, seed):
+    """ count random request bodies, each using one of rates randomly chosen rate settings. """
+    rng = random.Random(seed)
+    pool = [{"game": rng.choice(gameList), "followup": rng.choice(["Neither", "Player", "Enemy"]),
+             "hit1": rng.randint(1, 100), "hit2": rng.randint(1, 100),
+             "crit1": rng.choice([0, 5, 10, 20]), "crit2": rng.choice([0, 5, 10, 20])} for _ in range(rates)]
+    bodies = []
+    for _ in range(count):
+        body = dict(rng.choice(pool))
+        body.update({"dmg1": rng.randint(1, 20), "dmg2": rng.randint(1, 20),
+                     "hp1": rng.randint(1, maxHP), "hp2": rng.randint(1, maxHP)})
+        bodies.append(body)
+    return bodies
+
+async def run(host, port, bodies, connections):
+    """ Sends the bodies over the given number of connections. Returns (latencies, statuses, seconds). """
+    queue = list(reversed(bodies))
+    latencies, statuses = [], {}
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while queue:
+                body = queue.pop()
+                start = time.perf_counter()
+                status, _ = await request(reader, writer, host, "POST", "/solve", body)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(connections)])
+    return latencies, statuses, time.perf_counter() - start
+
+async def metrics(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        return (await request(reader, writer, host, "GET", "/metrics"))[1]
+    finally:
+        writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the solver service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("-n", "--requests", type=int, default=1000)
+    parser.add_argument("-c", "--connections", type=int, default=16)
+    parser.add_argument("--rates", type=int, default=8, help="distinct rate settings the requests draw from")
+    parser.add_argument("--max-hp", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    bodies = makeRequests(args.requests, args.rates, args.max_hp, args.seed)
+    latencies, statuses, seconds = asyncio.run(run(args.host, args.port, bodies, args.connections))
+    latencies.sort()
+    percentile = lambda q: 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print("%d requests over %d connections in %.3f s: %.1f requests/s" % (len(latencies), args.connections, \
+          seconds, len(latencies) / seconds))
+    print("statuses: %s" % ", ".join("%d x%d" % item for item in sorted(statuses.items())))
+    print("latency ms: mean %.2f  p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % (1000 * sum(latencies) / len(latencies), \
+          percentile(0.5), percentile(0.9), percentile(0.99), 1000 * latencies[-1]))
+    print("server metrics:")
+    print(json.dumps(asyncio.run(metrics(args.host, args.port)), indent=1, sort_keys=True))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/python3
+
+"""
+lookup.py
+
+Precomputed lookup store for common arena matchups. The build step solves float64 tables for a configurable
+domain of displayed hit rates, crit rates, true hit families and follow-up settings, and writes them to a
+single binary file. At runtime the file is opened with mmap, so a lookup is an index computation and one
+8-byte read, and nothing is loaded up front. Matchups outside the stored domain fall back to the live DP.
+
+File layout (all integers little-endian):
+
+    offset  size        contents
+    0       8           magic b"FEARENA1"
+    8       4 * 8       uint32 fields: version (1), M, N, nFamilies, nModes, nHits, nCrits, header size
+    40      nFamilies   uint8 family codes (0 = 1RN, 1 = 2RN, 2 = Fates, the order of the families list)
+    ...     nModes      uint8 follow-up codes (0 = Neither, 1 = Player, 2 = Enemy, as in followupModes)
+    ...     nHits       uint8 displayed hit rates, ascending
+    ...     nCrits      uint8 crit rates, ascending
+    ...                 zero padding up to the header size, a multiple of 8
+    header  8 * count   float64 victory probabilities in C order with shape
+                        (nFamilies, nModes, nHits, nHits, nCrits, nCrits, M+1, N+1),
+                        indexed by (family, mode, player hit, enemy hit, player crit, enemy crit, i, j)
+
+Cell (i, j) holds the victory probability when the player can take i hits and the enemy can take j hits,
+as in BattleTable. Tables where neither side can hit are filled with NaN; lookups never reach them.
+
+Usage: python lookup.py build arena.lut [--hits 0-100:10] [--crits 0,10,20,30] [--max-hits 30]
+       python lookup.py query arena.lut GAME FOLLOWUP HIT1 HIT2 DMG1 DMG2 CRIT1 CRIT2 HP1 HP2
+"""
+
+import argparse
+import mmap
+import struct
+import sys
+from fractions import Fraction
+
+from solver import _1RN_games, _2RN_games, DP_float, followupModes, hitsToKill, np, solveBattle, trueHit, \
+                   validateBattle
+
+
+MAGIC = b"FEARENA1"
+VERSION = 1
+_header = struct.Struct("<8I")
+
+# True hit families, in file code order, with a representative game used for the true hit lookup
+families = ["1RN", "2RN", "Fates"]
+_familyGames = {"1RN": _1RN_games[0], "2RN": _2RN_games[0], "Fates": "Fates"}
+
+def familyOf(game):
+    """ The true hit family of a game. Games in the same family share stored tables. """
+    if game in _1RN_games:
+        return "1RN"
+    elif game in _2RN_games:
+        return "2RN"
+    return "Fates"
+
+
+###############################################################################
+################################# Build step ##################################
+###############################################################################
+
+def build(path, hits=range(0, 101, 10), crits=(0, 10, 20, 30), M=30, N=30, familyList=families, \
+          modes=followupModes, progress=None):
+    """ Solves every table in the domain and writes the store to path. The tables are written one at a time,
+        so memory use doesn't grow with the size of the domain. progress, if given, is called with the
+        number of tables written and the total. """
+    if np is None:
+        raise ImportError("Building a lookup store requires NumPy.")
+    hits, crits = sorted(set(hits)), sorted(set(crits))
+    if not all(0 <= x <= 100 for x in list(hits) + list(crits)):
+        raise ValueError("Hit and crit rates must be between 0 and 100 (inclusive).")
+
+    codes = bytearray([families.index(f) for f in familyList] + [followupModes.index(f) for f in modes] \
+                      + list(hits) + list(crits))
+    headerSize = 8 + _header.size + len(codes)
+    headerSize += -headerSize % 8
+    nan = np.full((M + 1, N + 1), np.nan)
+    total = len(familyList) * len(modes) * len(hits) ** 2 * len(crits) ** 2
+    done = 0
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_header.pack(VERSION, M, N, len(familyList), len(modes), len(hits), len(crits), headerSize))
+        f.write(bytes(codes))
+        f.write(b"\0" * (headerSize - 8 - _header.size - len(codes)))
+        for family in familyList:
+            game = _familyGames[family]
+            for followup in modes:
+                for hit1 in hits:
+                    for hit2 in hits:
+                        p1, p2 = trueHit(game, hit1), trueHit(game, hit2)
+                        for crit1 in crits:
+                            for crit2 in crits:
+                                if p1 == 0 and p2 == 0:
+                                    table = nan
+                                else:
+                                    table = DP_float(followup, M, N, p1, p2, Fraction(crit1, 100), \
+                                                     Fraction(crit2, 100), full=True)
+                                f.write(np.ascontiguousarray(table, dtype="<f8").tobytes())
+                                done += 1
+                                if progress is not None:
+                                    progress(done, total)
+
+
+###############################################################################
+################################ Runtime lookups ##############################
+###############################################################################
+
+class LookupStore(object):
+    """ Read-only view of a store written by build(). The file is memory-mapped, so opening it only reads
+        the header and each lookup touches a single page. """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm[:8] != MAGIC:
+            raise ValueError("%s is not an arena lookup store." % path)
+        version, self.M, self.N, nFamilies, nModes, nHits, nCrits, self.headerSize = \
+            _header.unpack_from(self.mm, 8)
+        if version != VERSION:
+            raise ValueError("Unsupported lookup store version %d." % version)
+        codes = bytearray(self.mm[8 + _header.size : 8 + _header.size + nFamilies + nModes + nHits + nCrits])
+
+        # Position of each family, mode, hit and crit rate along its axis of the data array (-1 if absent)
+        self.familyIndex = dict((families[c], k) for k, c in enumerate(codes[:nFamilies]))
+        self.modeIndex = dict((followupModes[c], k) for k, c in enumerate(codes[nFamilies:nFamilies + nModes]))
+        self.hitIndex, self.critIndex = [-1] * 101, [-1] * 101
+        for k, x in enumerate(codes[nFamilies + nModes : nFamilies + nModes + nHits]):
+            self.hitIndex[x] = k
+        for k, x in enumerate(codes[nFamilies + nModes + nHits:]):
+            self.critIndex[x] = k
+
+        # Strides, in cells, of the (family, mode, hit1, hit2, crit1, crit2, i, j) axes
+        shape = [nFamilies, nModes, nHits, nHits, nCrits, nCrits, self.M + 1, self.N + 1]
+        self.strides = [1] * len(shape)
+        for k in range(len(shape) - 2, -1, -1):
+            self.strides[k] = self.strides[k + 1] * shape[k + 1]
+
+        self.lookups = 0
+        self.fallbacks = 0
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+    def index(self, game, hit, crit, m, n, followup):
+        """ Cell number of the matchup in the data array, or None if it is outside the stored domain. """
+        position = [self.familyIndex.get(familyOf(game), -1), self.modeIndex.get(followup, -1), \
+                    self.hitIndex[hit[0]], self.hitIndex[hit[1]], self.critIndex[crit[0]], \
+                    self.critIndex[crit[1]], m if m <= self.M else -1, n if n <= self.N else -1]
+        if min(position) < 0:
+            return None
+        return sum(k * stride for k, stride in zip(position, self.strides))
+
+    def lookup(self, game, hit, dmg, crit, hp, followup="Neither"):
+        """ Player's victory probability as a float, read from the store when the matchup is inside the
+            stored domain and solved with the live DP otherwise. Takes the same arguments as solveBattle()
+            and raises InputError for the same problems. """
+        validateBattle(game, hit, dmg, crit, hp, followup)
+        # If the player can't hit/damage the enemy, then the enemy will win, and likewise for the enemy
+        if hit[0] == 0 or dmg[0] == 0:
+            return 0.0
+        if hit[1] == 0 or dmg[1] == 0:
+            return 1.0
+
+        cell = self.index(game, hit, crit, hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0]), followup)
+        if cell is None:
+            self.fallbacks += 1
+            return float(solveBattle(game, hit, dmg, crit, hp, followup, "float" if np is not None else "exact"))
+        self.lookups += 1
+        return struct.unpack_from("<d", self.mm, self.headerSize + 8 * cell)[0]
+
+
+###############################################################################
+############################# Command-line usage ##############################
+###############################################################################
+
+def parseRates(text):
+    """ Parses a list of rates such as "0,10,20", "0-100" or "0-100:5" (start-stop:step, inclusive). """
+    rates = []
+    for part in text.split(","):
+        if "-" in part:
+            bounds, _, step = part.partition(":")
+            start, stop = bounds.split("-")
+            rates += list(range(int(start), int(stop) + 1, int(step or 1)))
+        else:
+            rates.append(int(part))
+    return rates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query a precomputed arena lookup store.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    buildParser = commands.add_parser("build", help="precompute a store")
+    buildParser.add_argument("path")
+    buildParser.add_argument("--hits", type=parseRates, default=parseRates("0-100:10"))
+    buildParser.add_argument("--crits", type=parseRates, default=parseRates("0,10,20,30"))
+    buildParser.add_argument("--max-hits", type=int, default=30, help="largest m and n stored")
+    buildParser.add_argument("--families", nargs="+", choices=families, default=families)
+    buildParser.add_argument("--modes", nargs="+", choices=followupModes, default=followupModes)
+
+    queryParser = commands.add_parser("query", help="look up one matchup")
+    queryParser.add_argument("path")
+    queryParser.add_argument("game")
+    queryParser.add_argument("followup", choices=followupModes)
+    queryParser.add_argument("values", nargs=8, type=int, metavar="HIT1 HIT2 DMG1 DMG2 CRIT1 CRIT2 HP1 HP2")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        def progress(done, total):
+            if done % 1000 == 0 or done == total:
+                sys.stderr.write("\r%d/%d tables" % (done, total))
+        build(args.path, args.hits, args.crits, args.max_hits, args.max_hits, args.families, args.modes, progress)
+        sys.stderr.write("\n")
+    else:
+        v = args.values
+        store = LookupStore(args.path)
+        print(100 * store.lookup(args.game, (v[0], v[1]), (v[2], v[3]), (v[4], v[5]), (v[6], v[7]), args.followup))
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+
+"""
+resultcache.py
+
+Persistent cache of exact results, shared by GUI sessions, batch runs and the warm-up command below. It is
+an SQLite database in the user's cache directory (or the path in ARENA_RESULT_CACHE). Results are keyed by
+what the dynamic program actually solves: the strike order, the true hit and crit rates as fractions, and
+the hit counts m and n. So matchups from different games, or with different HP and Dmg, that come down to
+the same DP share one entry. Values are the exact numerator and denominator.
+
+Any number of processes can use the same database at once: it runs in WAL mode, so lookups never wait for
+writers, and writers take the write lock for one short transaction at a time and wait up to the timeout for
+it. Least recently used entries are evicted once the stored results take more than the size limit. A hit
+only notes its time of use in memory; the times are written with the next store, or in batches that give up
+after a few milliseconds (and try again later) if another process holds the write lock.
+
+Usage: python resultcache.py warm matchups.csv [--processes N] [--backend integer]   solve and store
+       python resultcache.py import results.csv    store the results of an earlier batch.py run
+       python resultcache.py stats
+       python resultcache.py clear
+       Every command takes --path (default: the user cache directory) and --max-mb (default 256).
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from fractions import Fraction
+
+from solver import InputError, hitsToKill, solveBattle, strikeOrder, trueHit, validateBattle
+
+
+SCHEMA_VERSION = 1
+
+# Hits whose time of use is kept in memory before trying to write them, and how long that write waits for the
+# write lock, in seconds
+USED_BATCH = 256
+USED_TIMEOUT = 0.05
+
+def defaultPath():
+    """ ARENA_RESULT_CACHE if set, and otherwise results.sqlite in the platform's user cache directory. """
+    if os.environ.get("ARENA_RESULT_CACHE"):
+        return os.environ["ARENA_RESULT_CACHE"]
+    if sys.platform.startswith("win"):
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "fe-arena", "results.sqlite")
+
+def canonicalKey(followup, m, n, p1, p2, c1, c2):
+    """ The cache key of a DP solve: the strike order, then m and n, then the rates as exact fractions. """
+    return "%s|%d|%d|%s|%s|%s|%s" % (strikeOrder(followup), m, n, Fraction(p1), Fraction(p2), Fraction(c1), \
+                                      Fraction(c2))
+
+def matchupKey(game, hit, dmg, crit, hp, followup="Neither"):
+    """ The cache key of a matchup (solveBattle() arguments), or None if it needs no DP: when either side
+        can't hit/damage the other. """
+    if hit[0] == 0 or dmg[0] == 0 or hit[1] == 0 or dmg[1] == 0:
+        return None
+    return canonicalKey(followup, hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0]), trueHit(game, hit[0]), \
+                        trueHit(game, hit[1]), Fraction(crit[0], 100), Fraction(crit[1], 100))
+
+
+###############################################################################
+################################# Result cache ################################
+###############################################################################
+
+class ResultCache(object):
+    """ Persistent cache of exact victory probabilities. One instance can be shared by the threads of a
+        process; each process opens its own. """
+    def __init__(self, path=None, maxBytes=256 * 2**20, timeout=30.0):
+        self.path = path or defaultPath()
+        self.maxBytes = maxBytes
+        self.timeout = timeout
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Another process may have created it in the meantime
+                if not os.path.isdir(directory):
+                    raise
+        # Transactions are begun explicitly, so that writes take the write lock up front
+        self.db = sqlite3.connect(self.path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Times of use of recent hits, by key, not yet written
+        self.used = {}
+        self.flushAt = USED_BATCH
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.transaction():
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, numerator TEXT NOT NULL, "
+                            "denominator TEXT NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS resultsUsed ON results (used)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('version', ?)", (SCHEMA_VERSION,))
+            self.db.execute("INSERT OR IGNORE INTO meta VALUES ('bytes', 0)")
+            version = self.db.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.close()
+            raise ValueError("%s has an unsupported result cache version (%d)." % (self.path, version))
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def get(self, key):
+        """ The stored Fraction for a key, or None. A hit marks the entry as recently used (see flushUsed()). """
+        with self.lock:
+            row = self.db.execute("SELECT numerator, denominator FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.used[key] = time.time()
+            full = len(self.used) >= self.flushAt
+        if full:
+            self.flushUsed()
+        return Fraction(int(row[0]), int(row[1]))
+
+    def flushUsed(self, timeout=USED_TIMEOUT):
+        """ Writes the times of use of recent hits, waiting at most timeout seconds for the write lock. If
+            another process holds it longer, they are kept, and get() tries again after another USED_BATCH
+            hits. """
+        with self.lock:
+            if not self.used:
+                return
+            self.db.execute("PRAGMA busy_timeout = %d" % int(timeout * 1000))
+            try:
+                self.db.execute("BEGIN IMMEDIATE")
+            except sqlite3.OperationalError:
+                self.flushAt = len(self.used) + USED_BATCH
+                return
+            finally:
+                self.db.execute("PRAGMA busy_timeout = %d" % int(self.timeout * 1000))
+            try:
+                self._writeUsed()
+                self.db.execute("COMMIT")
+            except Exception:
+                self.db.execute("ROLLBACK")
+                raise
+
+    def _writeUsed(self):
+        """ Writes the pending times of use. Runs inside a write transaction. """
+        self.db.executemany("UPDATE results SET used = ? WHERE key = ?", \
+                            [(used, key) for key, used in self.used.items()])
+        self.used.clear()
+        self.flushAt = USED_BATCH
+
+    def put(self, key, value):
+        self.putMany([(key, value)])
+
+    def putMany(self, entries):
+        """ Stores (key, Fraction) pairs in one transaction, then evicts the least recently used entries while
+            the cache is over its size limit. """
+        now = time.time()
+        with self.transaction():
+            added = 0
+            for key, value in entries:
+                value = Fraction(value)
+                numerator, denominator = str(value.numerator), str(value.denominator)
+                size = len(key) + len(numerator) + len(denominator)
+                old = self.db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", \
+                                (key, numerator, denominator, size, now))
+                added += size - (old[0] if old else 0)
+            self.db.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (added,))
+            # Recent hits count as used before anything is evicted
+            self._writeUsed()
+            self._evict()
+
+    def _evict(self):
+        """ Drops the least recently used entries until the cache fits. Runs inside a write transaction. """
+        total = self.db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        if total <= self.maxBytes:
+            return
+        victims = []
+        for key, size in self.db.execute("SELECT key, size FROM results ORDER BY used"):
+            if total <= self.maxBytes:
+                break
+            victims.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM results WHERE key = ?", victims)
+        self.db.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (max(total, 0),))
+
+    def solve(self, game, hit, dmg, crit, hp, followup="Neither", backend="integer", cache=None, progress=None):
+        """ solveBattle() through the cache: returns the stored Fraction if there is one, and otherwise
+            solves with the given exact backend (and TableCache, if any) and stores the result. Raises
+            InputError if the parameters are invalid. """
+        validateBattle(game, hit, dmg, crit, hp, followup)
+        key = matchupKey(game, hit, dmg, crit, hp, followup)
+        victory = self.get(key) if key is not None else None
+        if victory is None:
+            victory = solveBattle(game, hit, dmg, crit, hp, followup, backend, cache, progress)
+            if key is not None:
+                try:
+                    self.put(key, victory)
+                except sqlite3.OperationalError:
+                    # The database stayed locked for the whole timeout; the result just isn't cached
+                    pass
+        return victory
+
+    def clear(self):
+        with self.transaction():
+            self.db.execute("DELETE FROM results")
+            self.used.clear()
+            self.db.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
+
+    def stats(self):
+        """ Entry count and size of the whole cache, and this instance's hits and misses. """
+        with self.lock:
+            entries = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            size = self.db.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        return {"path": self.path, "entries": entries, "bytes": size, "maxBytes": self.maxBytes,
+                "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        self.flushUsed()
+        self.db.close()
+
+class _Transaction(object):
+    """ A write transaction holding the instance's lock; commits on success and rolls back on errors. """
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __enter__(self):
+        self.cache.lock.acquire()
+        try:
+            self.cache.db.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.cache.lock.release()
+            raise
+
+    def __exit__(self, kind, value, traceback):
+        try:
+            self.cache.db.execute("COMMIT" if kind is None else "ROLLBACK")
+        finally:
+            self.cache.lock.release()
+
+
+###############################################################################
+############################# Command-line usage ##############################
+###############################################################################
+
+def importResults(cache, rows):
+    """ Stores the results of batch.py output rows that have a numerator and denominator, a thousand per
+        transaction. Returns the number of results stored. """
+    from batch import parseRow
+    entries, stored = [], 0
+    for row in rows:
+        if not isinstance(row, dict) or not row.get("numerator") or not row.get("denominator"):
+            continue
+        try:
+            key = matchupKey(*parseRow(row))
+            value = Fraction(int(row["numerator"]), int(row["denominator"]))
+        except (InputError, ValueError, ZeroDivisionError):
+            continue
+        if key is not None:
+            entries.append((key, value))
+        if len(entries) == 1000:
+            cache.putMany(entries)
+            stored += len(entries)
+            entries = []
+    cache.putMany(entries)
+    return stored + len(entries)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the persistent result cache.")
+    parser.add_argument("--path", default=None, help="database file (default: %s)" % defaultPath())
+    parser.add_argument("--max-mb", type=float, default=256, help="size limit, in MB")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    warmParser = commands.add_parser("warm", help="solve matchups from a CSV/JSONL file into the cache")
+    warmParser.add_argument("input", help='CSV or JSONL file of matchups, as for batch.py ("-" for stdin)')
+    warmParser.add_argument("-p", "--processes", type=int, default=None, help="worker processes")
+    warmParser.add_argument("--backend", choices=["exact", "integer"], default="integer")
+    importParser = commands.add_parser("import", help="store the results of a batch.py run")
+    importParser.add_argument("input", help="batch.py output file, CSV or JSONL")
+    commands.add_parser("stats", help="print the cache's size")
+    commands.add_parser("clear", help="drop every cached result")
+    args = parser.parse_args(argv)
+
+    from batch import formatOf, readRows, solveStream
+    path = args.path or defaultPath()
+    maxBytes = int(args.max_mb * 2**20)
+    if args.command == "warm":
+        source = sys.stdin if args.input == "-" else open(args.input, newline="")
+        try:
+            count = 0
+            for row, result in solveStream(readRows(source, formatOf(args.input, None)), args.processes, \
+                                           backend=args.backend, resultCache=(path, maxBytes)):
+                count += 1
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        sys.stderr.write("%d matchups solved or found\n" % count)
+        return
+
+    cache = ResultCache(path, maxBytes)
+    try:
+        if args.command == "import":
+            with open(args.input, newline="") as source:
+                count = importResults(cache, readRows(source, formatOf(args.input, None)))
+            sys.stderr.write("%d results imported\n" % count)
+        elif args.command == "clear":
+            cache.clear()
+        stats = cache.stats()
+        print("%s: %d results, %.1f MB of %.1f MB" % (stats["path"], stats["entries"], stats["bytes"] / 2.0**20, \
+              stats["maxBytes"] / 2.0**20))
+    finally:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
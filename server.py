@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+
+"""
+server.py
+
+Long-running local solver service: a small asyncio HTTP/JSON server. Requires Python 3.7+.
+
+    POST /solve     body: {"game": ..., "followup": ..., "hit1": ..., "hit2": ..., "dmg1": ..., "dmg2": ...,
+                           "crit1": ..., "crit2": ..., "hp1": ..., "hp2": ..., "backend": ...}
+                    The fields are the ones the GUI reads (1 is the player, 2 the enemy), with the same
+                    defaults as batch.py; backend is optional. Returns {"numerator": ..., "denominator": ...,
+                    "percent": ...}, with the numerator and denominator as decimal strings (they are often too
+                    big for JSON number parsers), or {"percent": ...} for the float backend. Invalid input
+                    gets status 400 and {"error": ..., "message": ...}. With a "tolerance" field (an absolute
+                    error in the probability), the backend field is ignored: the answer comes from a float
+                    table if solver.floatErrorBound() certifies it to within the tolerance, and from an exact
+                    one otherwise, and the response adds "path" ("float" or "exact") and "bound".
+    GET /metrics    Request counts, latency percentiles, throughput, and table/coalescing counters.
+    GET /health     {"status": "ok"}
+
+DP tables are solved in a process pool, so the event loop never blocks on the CPU-heavy work. Tables are kept
+in a TableCache, and concurrent requests that need a table for the same rates share one computation: while a
+table is being solved, other requests for the same rates wait for it instead of starting their own.
+
+Usage: python server.py [--host 127.0.0.1] [--port 8080] [--workers N] [--backend integer] [--cache-mb 256]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+
+from batch import parseRow
+from solver import FLOAT_KERNELS, BattleTable, InputError, TableCache, backends, floatErrorBound, floatKernel, \
+                   hitsToKill, strikeOrder, trueHit, validateBattle
+
+
+# Latencies kept for the percentiles reported by /metrics, and the window used for the recent throughput
+LATENCY_SAMPLES = 10000
+THROUGHPUT_WINDOW = 60.0
+
+# Largest request body accepted, in bytes
+MAX_BODY = 65536
+
+_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def solveTable(followup, m, n, p1, p2, c1, c2, backend, table):
+    """ Runs in a worker process: solves a table, extending the given one if there is one. Returns the table
+        and its size, so the event loop doesn't have to measure it. """
+    table = table.extended(m, n) if table is not None else BattleTable(followup, m, n, p1, p2, c1, c2, backend)
+    return table, table.nbytes()
+
+
+###############################################################################
+################################ Solver service ###############################
+###############################################################################
+
+class SolverService(object):
+    """ Answers solve requests from the table cache, computing tables in the executor and coalescing
+        concurrent requests for the same rates into one computation. """
+    def __init__(self, executor, backend="integer", maxBytes=256 * 2**20):
+        self.executor = executor
+        self.backend = backend
+        self.cache = TableCache(maxBytes)
+        # Table computations in progress, by rate key
+        self.pending = {}
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.statuses = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.recent = deque()
+        self.tablesSolved = 0
+        self.tablesExtended = 0
+        # Exact tables solved again at a larger size rather than extended (see table())
+        self.tablesResolved = 0
+        self.cacheHits = 0
+        self.coalesced = 0
+        # Float kernels for certifying tolerance requests, by strike order and rates (see kernel())
+        self.kernels = OrderedDict()
+        # Tolerance requests answered by each path
+        self.paths = {"float": 0, "exact": 0}
+
+    async def table(self, followup, m, n, p1, p2, c1, c2, backend):
+        """ Returns a table for the given rates covering (m, n). """
+        key = (followup, p1, p2, c1, c2, backend)
+        while True:
+            table = self.cache.find(followup, p1, p2, c1, c2, backend)
+            if table is not None and table.m >= m and table.n >= n:
+                self.cacheHits += 1
+                return table
+            if key not in self.pending:
+                break
+            # Someone is already solving a table for these rates; wait for it and check again, since it may
+            # be too small for this request
+            self.coalesced += 1
+            try:
+                await asyncio.shield(self.pending[key])
+            except Exception:
+                pass
+
+        loop = asyncio.get_running_loop()
+        if table is not None:
+            # The new table covers both, so grow to the larger of each dimension
+            m, n = max(m, table.m), max(n, table.n)
+            # Tables go to and from the workers pickled. Float and integer tables hold plain numbers, but an
+            # exact one is a Fraction per cell, and unpickling normalizes each of them again: sending it to
+            # be extended costs about as much as solving the new table from scratch, which is done instead.
+            # The new exact table still has to come back.
+            if backend == "exact":
+                table = None
+                self.tablesResolved += 1
+        future = loop.run_in_executor(self.executor, solveTable, followup, m, n, p1, p2, c1, c2, backend, table)
+        self.pending[key] = future
+        try:
+            result, size = await future
+        finally:
+            del self.pending[key]
+        if table is None:
+            self.tablesSolved += 1
+        else:
+            self.tablesExtended += 1
+        self.cache.add(result, size)
+        return result
+
+    async def kernel(self, followup, p1, p2, c1, c2):
+        """ The float kernel for the given rates. Compiling one can take a while for long strike orders, so
+            it is done in the executor, once per rate key. """
+        key = (strikeOrder(followup), p1, p2, c1, c2)
+        terms = self.kernels.pop(key, None)
+        if terms is None:
+            loop = asyncio.get_running_loop()
+            terms = await loop.run_in_executor(self.executor, floatKernel, followup, p1, p2, c1, c2)
+            if len(self.kernels) >= FLOAT_KERNELS:
+                self.kernels.popitem(last=False)
+        self.kernels[key] = terms
+        return terms
+
+    async def solve(self, request):
+        """ Solves one request body (a dict) and returns the response body. Raises InputError for bad input. """
+        backend = request.get("backend", self.backend)
+        if backend not in backends:
+            raise InputError("Selection error", 'Backend must be one of "exact", "float" or "integer".')
+        tolerance = request.get("tolerance")
+        if tolerance is not None and (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) \
+                                      or tolerance < 0):
+            raise InputError("Input error", "tolerance must be a non-negative number.")
+        game, hit, dmg, crit, hp, followup = parseRow(request)
+        validateBattle(game, hit, dmg, crit, hp, followup)
+
+        # If either side can't hit/damage the other, the battle needs no table
+        bound = 0.0
+        if hit[0] == 0 or dmg[0] == 0:
+            victory = Fraction(0)
+        elif hit[1] == 0 or dmg[1] == 0:
+            victory = Fraction(1)
+        else:
+            m, n = hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0])
+            p1, p2, c1, c2 = trueHit(game, hit[0]), trueHit(game, hit[1]), Fraction(crit[0], 100), \
+                             Fraction(crit[1], 100)
+            if tolerance is not None:
+                bound = floatErrorBound(await self.kernel(followup, p1, p2, c1, c2), m, n)
+                backend = "float" if bound <= tolerance else "integer"
+            table = await self.table(followup, m, n, p1, p2, c1, c2, backend)
+            victory = table.cell(m, n)
+
+        if backend == "float":
+            body = {"percent": 100 * float(victory)}
+        else:
+            body = {"numerator": str(victory.numerator), "denominator": str(victory.denominator),
+                    "percent": float(100 * victory)}
+            bound = 0.0
+        if tolerance is not None:
+            path = "float" if backend == "float" else "exact"
+            self.paths[path] += 1
+            body.update({"path": path, "bound": bound})
+        return body
+
+    def record(self, status, latency):
+        now = time.time()
+        self.requests += 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status >= 400:
+            self.errors += 1
+        self.latencies.append(latency)
+        self.recent.append(now)
+        while self.recent and self.recent[0] < now - THROUGHPUT_WINDOW:
+            self.recent.popleft()
+
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        uptime = time.time() - self.started
+        return {"uptime": uptime, "requests": self.requests, "errors": self.errors,
+                "statuses": dict((str(k), v) for k, v in self.statuses.items()),
+                "throughput": {"overall": self.requests / uptime if uptime > 0 else 0.0,
+                               "recent": len(self.recent) / min(THROUGHPUT_WINDOW, uptime) if uptime > 0 else 0.0},
+                "latency": {"samples": len(latencies),
+                            "mean": sum(latencies) / len(latencies) if latencies else None,
+                            "p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99),
+                            "max": latencies[-1] if latencies else None},
+                "tables": {"solved": self.tablesSolved, "extended": self.tablesExtended,
+                           "resolved": self.tablesResolved, "cacheHits": self.cacheHits,
+                           "coalesced": self.coalesced, "pending": len(self.pending),
+                           "cached": len(self.cache.tables), "bytes": self.cache.bytes,
+                           "maxBytes": self.cache.maxBytes, "evictions": self.cache.evictions},
+                "paths": dict(self.paths)}
+
+
+###############################################################################
+################################# HTTP server #################################
+###############################################################################
+
+async def readRequest(reader):
+    """ Reads one HTTP request. Returns (method, path, headers, body), or None at the end of the connection. """
+    line = await reader.readline()
+    if not line:
+        return None
+    method, path, version = line.decode("latin-1").split()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("Request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, path, headers, body
+
+def response(status, body, keepAlive):
+    data = json.dumps(body).encode()
+    head = "HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n" \
+           % (status, _reasons[status], len(data), "keep-alive" if keepAlive else "close")
+    return head.encode("latin-1") + data
+
+async def route(service, method, path, body):
+    """ Returns (status, response body) for a request. """
+    if path == "/health":
+        return 200, {"status": "ok"}
+    if path == "/metrics":
+        return 200, service.metrics()
+    if path != "/solve":
+        return 404, {"error": "Not found", "message": "Unknown path %s" % path}
+    if method != "POST":
+        return 405, {"error": "Method not allowed", "message": "Use POST for /solve"}
+    try:
+        request = json.loads(body.decode() or "{}")
+        if not isinstance(request, dict):
+            raise ValueError("The request body must be a JSON object")
+        return 200, await service.solve(request)
+    except InputError as e:
+        return 400, {"error": e.title, "message": e.message}
+    except ValueError as e:
+        return 400, {"error": "Input error", "message": str(e)}
+
+async def handle(service, reader, writer):
+    try:
+        while True:
+            try:
+                request = await readRequest(reader)
+            except (ValueError, asyncio.IncompleteReadError) as e:
+                writer.write(response(400, {"error": "Bad request", "message": str(e)}, False))
+                break
+            if request is None:
+                break
+            method, path, headers, body = request
+            keepAlive = headers.get("connection", "").lower() != "close"
+            start = time.perf_counter()
+            try:
+                status, result = await route(service, method, path, body)
+            except Exception as e:
+                status, result = 500, {"error": "Internal error", "message": str(e)}
+            if path == "/solve":
+                service.record(status, time.perf_counter() - start)
+            writer.write(response(status, result, keepAlive))
+            await writer.drain()
+            if not keepAlive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve(host, port, workers, backend, maxBytes):
+    with ProcessPoolExecutor(workers) as executor:
+        service = SolverService(executor, backend, maxBytes)
+        server = await asyncio.start_server(lambda r, w: handle(service, r, w), host, port)
+        print("Serving on http://%s:%d" % (host, port), flush=True)
+        async with server:
+            await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON solver service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="solver processes (default: all cores)")
+    parser.add_argument("--backend", choices=backends, default="integer", help="default backend for requests")
+    parser.add_argument("--cache-mb", type=float, default=256, help="table cache size, in MB")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.backend, int(args.cache_mb * 2**20)))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
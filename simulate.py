@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+
+"""
+simulate.py
+
+Monte Carlo battle simulator, as an independent check on the dynamic programs. Battles are played out the
+way the games play them, many at once as NumPy arrays: HP is tracked in HP (not in hits), a critical hit
+deals triple damage, and every strike draws its own random numbers instead of using the true hit tables:
+
+    1RN games       one RN from 0-99; the strike hits if RN < hit
+    2RN games       two RNs; the strike hits if (RN1 + RN2) / 2 < hit
+    Fates           one RN below 50 hit, otherwise two RNs; the strike hits if (3*RN1 + RN2) / 4 < hit
+    Crits           one RN, drawn for strikes that hit; the strike crits if RN < crit
+
+The check command solves random matchups with the exact DP and simulates each of them, and flags every
+matchup where the simulated win rate lies outside the confidence interval around the exact probability.
+The interval is widened for the number of matchups (Bonferroni), so a correct solver fails the whole check
+with probability about alpha. Requires NumPy 1.17+ and Python 3.8+.
+
+Usage: python simulate.py run GAME FOLLOWUP HIT1 HIT2 DMG1 DMG2 CRIT1 CRIT2 HP1 HP2 [-n 1000000] [--seed 0]
+       python simulate.py check [--cases 200] [-n 200000] [--seed 0] [--alpha 0.001]
+"""
+
+import argparse
+import random
+import sys
+import time
+from statistics import NormalDist
+
+from solver import _1RN_games, _2RN_games, followupModes, gameList, InputError, np, solveBattle, strikeOrder, \
+                   validateBattle
+
+
+###############################################################################
+################################## Simulator ##################################
+###############################################################################
+
+def strikeHits(rng, game, hit, size):
+    """ Whether each of size strikes at the displayed hit rate connects, drawing RNs as the game does. """
+    if game in _1RN_games or (game not in _2RN_games and hit < 50):
+        return rng.integers(0, 100, size, dtype=np.uint8) < hit
+    rn1 = rng.integers(0, 100, size, dtype=np.uint16)
+    rn2 = rng.integers(0, 100, size, dtype=np.uint16)
+    if game in _2RN_games:
+        return rn1 + rn2 < 2 * hit
+    return 3 * rn1 + rn2 < 4 * hit
+
+def strikeDamage(rng, game, hit, dmg, crit, size):
+    """ Damage dealt by each of size strikes: 0 on a miss, dmg on a hit and 3 * dmg on a critical hit. """
+    hits = strikeHits(rng, game, hit, size)
+    crits = rng.integers(0, 100, size, dtype=np.uint8) < crit
+    return hits * np.where(crits, 3 * dmg, dmg)
+
+def simulateBattles(game, hit, dmg, crit, hp, followup="Neither", battles=1000000, seed=None, chunk=2**20):
+    """ Plays out the given number of battles and returns how many the player wins. Takes the same
+        arguments as solveBattle(), and seed is passed to numpy.random.default_rng (an int, or a Generator
+        to continue its stream). Battles are played chunk at a time, and each round is played for all the
+        battles in a chunk that are still going. Raises InputError if the parameters are invalid. """
+    validateBattle(game, hit, dmg, crit, hp, followup)
+    # As in solveBattle(), a side that can't hit/damage the other never wins; these battles would only end
+    # after an arbitrarily long run of rounds
+    if hit[0] == 0 or dmg[0] == 0:
+        return 0
+    if hit[1] == 0 or dmg[1] == 0:
+        return battles
+
+    rng = np.random.default_rng(seed)
+    order = strikeOrder(followup)
+    wins = 0
+    for start in range(0, battles, chunk):
+        size = min(chunk, battles - start)
+        hp1 = np.full(size, hp[0], dtype=np.int64)
+        hp2 = np.full(size, hp[1], dtype=np.int64)
+        while size > 0:
+            for striker in order:
+                # Battles that ended earlier in the round take no further damage
+                going = (hp1 > 0) & (hp2 > 0)
+                if striker == "P":
+                    hp2 -= going * strikeDamage(rng, game, hit[0], dmg[0], crit[0], size)
+                else:
+                    hp1 -= going * strikeDamage(rng, game, hit[1], dmg[1], crit[1], size)
+            wins += int(np.count_nonzero(hp2 <= 0))
+            going = (hp1 > 0) & (hp2 > 0)
+            hp1, hp2 = hp1[going], hp2[going]
+            size = len(hp1)
+    return wins
+
+
+###############################################################################
+############################## Statistical check ##############################
+###############################################################################
+
+def randomMatchups(count, seed=0, modes=followupModes + ["PPE", "PEPP"]):
+    """ count random valid matchups as solveBattle() argument tuples. Hit rates are kept to 10 and above so
+        that battles end in a reasonable number of rounds, and HP and Dmg are small enough that a side often
+        falls in the middle of a round. """
+    rng = random.Random(seed)
+    matchups = []
+    while len(matchups) < count:
+        game = rng.choice(gameList)
+        hit = (rng.randint(10, 100), rng.randint(10, 100))
+        dmg = (rng.randint(1, 20), rng.randint(1, 20))
+        crit = (rng.choice([0, 0, 5, 15, 30, 60]), rng.choice([0, 0, 5, 15, 30, 60]))
+        hp = (rng.randint(1, 45), rng.randint(1, 45))
+        matchups.append((game, hit, dmg, crit, hp, rng.choice(modes)))
+    return matchups
+
+def crossCheck(matchups, battles=200000, seed=0, alpha=0.001, log=None):
+    """ Simulates each matchup and compares its win rate with the exact DP. Returns a list of
+        (matchup, exact, simulated, z) for the matchups outside the confidence bounds. z is the number of
+        standard errors between the simulated and exact probabilities. """
+    critical = NormalDist().inv_cdf(1 - alpha / (2 * len(matchups)))
+    rng = np.random.default_rng(seed)
+    flagged = []
+    for k, matchup in enumerate(matchups):
+        exact = float(solveBattle(*matchup, backend="integer"))
+        wins = simulateBattles(*matchup, battles=battles, seed=rng)
+        simulated = wins / battles
+        error = (exact * (1 - exact) / battles) ** 0.5
+        if error > 0:
+            z = (simulated - exact) / error
+        else:
+            # A certain outcome must be simulated exactly
+            z = 0.0 if simulated == exact else float("inf")
+        if abs(z) > critical:
+            flagged.append((matchup, exact, simulated, z))
+        if log is not None:
+            log("%4d %-40s exact %.6f simulated %.6f z %+.2f%s" % (k, "%s %s %s %s %s %s" % matchup, exact, \
+                simulated, z, "  FLAGGED" if abs(z) > critical else ""))
+    return flagged
+
+
+###############################################################################
+############################# Command-line usage ##############################
+###############################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo arena simulator and DP cross-check.")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    runParser = commands.add_parser("run", help="simulate one matchup")
+    runParser.add_argument("game")
+    runParser.add_argument("followup", help='"Neither", "Player", "Enemy" or a strike order')
+    runParser.add_argument("values", nargs=8, type=int, metavar="HIT1 HIT2 DMG1 DMG2 CRIT1 CRIT2 HP1 HP2")
+    runParser.add_argument("-n", "--battles", type=int, default=1000000)
+    runParser.add_argument("--seed", type=int, default=None)
+
+    checkParser = commands.add_parser("check", help="compare random matchups with the exact DP")
+    checkParser.add_argument("--cases", type=int, default=200)
+    checkParser.add_argument("-n", "--battles", type=int, default=200000, help="battles per matchup")
+    checkParser.add_argument("--seed", type=int, default=0)
+    checkParser.add_argument("--alpha", type=float, default=0.001, help="false alarm rate for the whole check")
+    checkParser.add_argument("-v", "--verbose", action="store_true", help="print every matchup")
+    args = parser.parse_args(argv)
+
+    log = lambda line: sys.stderr.write(line + "\n")
+    if args.command == "run":
+        v = args.values
+        matchup = (args.game, (v[0], v[1]), (v[2], v[3]), (v[4], v[5]), (v[6], v[7]), args.followup)
+        try:
+            start = time.perf_counter()
+            wins = simulateBattles(*matchup, battles=args.battles, seed=args.seed)
+            seconds = time.perf_counter() - start
+            exact = float(solveBattle(*matchup, backend="integer"))
+        except InputError as e:
+            parser.exit(2, "%s: %s\n" % (e.title, e.message))
+        simulated = wins / args.battles
+        error = (simulated * (1 - simulated) / args.battles) ** 0.5
+        print("simulated %.4f%% +/- %.4f%% (95%%), exact %.4f%%" % (100 * simulated, 196 * error, 100 * exact))
+        print("%d battles in %.3f s: %.0f battles/s" % (args.battles, seconds, args.battles / seconds))
+    else:
+        matchups = randomMatchups(args.cases, args.seed)
+        start = time.perf_counter()
+        flagged = crossCheck(matchups, args.battles, args.seed, args.alpha, log if args.verbose else None)
+        for matchup, exact, simulated, z in flagged:
+            log("DIVERGENCE %s %s %s %s %s %s: exact %.6f, simulated %.6f (z = %+.2f)" % (matchup + \
+                (exact, simulated, z)))
+        log("%d of %d matchups outside the bounds (%d battles each, alpha %g, %.1f s)" % (len(flagged), \
+            len(matchups), args.battles, args.alpha, time.perf_counter() - start))
+        if flagged:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1448 @@
+#!/usr/bin/python3
+
+"""
+solver.py
+
+GUI-free solver for Fire Emblem arena battles. Importing this module does not touch Tkinter, so it can
+be used from scripts, batch jobs and worker processes without a display.
+"""
+
+import json
+import math
+import os
+import sys
+import time
+from collections import OrderedDict
+from fractions import Fraction
+try:
+    from math import gcd
+except ImportError:
+    # Python 2
+    from fractions import gcd
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is only needed for the float64 backend; the exact Fraction path works without it
+    np = None
+
+
+###############################################################################
+############################### True Hit Data #################################
+###############################################################################
+
+# True hit table for FE 1-5 (1RN, displayed hit is accurate)
+# Given displayed hit x, hit probability is _1RN[x]/100
+_1RN_games = ["Fire Emblem 1", "Gaiden", "Mystery of the Emblem", "Genealogy of the Holy War", "Thracia 776"]
+_1RN = range(101)
+
+# True hit table for FE 6-13 (2RN)
+# Given displayed hit x, hit probability is _2RN[x]/10000
+_2RN_games = ["Binding Blade", "Blazing Sword", "Sacred Stones", "Path of Radiance", "Radiant Dawn", \
+              "Shadow Dragon", "New Mystery of the Emblem", "Awakening"]
+_2RN = [0, 3, 10, 21, 36, 55, 78, 105, 136, 171, 210, 253, 300, 351, 406, 465, 528, 595, 666, 741, 820, 903, 990, 1081, 1176, 1275, 1378, 1485, 1596, 1711, 1830, 1953, 2080, 2211, 2346, 2485, 2628, 2775, 2926, 3081, 3240, 3403, 3570, 3741, 3916, 4095, 4278, 4465, 4656, 4851, 5050, 5247, 5440, 5629, 5814, 5995, 6172, 6345, 6514, 6679, 6840, 6997, 7150, 7299, 7444, 7585, 7722, 7855, 7984, 8109, 8230, 8347, 8460, 8569, 8674, 8775, 8872, 8965, 9054, 9139, 9220, 9297, 9370, 9439, 9504, 9565, 9622, 9675, 9724, 9769, 9810, 9847, 9880, 9909, 9934, 9955, 9972, 9985, 9994, 9999, 10000]
+
+# True hit table for FE Fates (1RN / weighted 2RN hybrid)
+# Hit rates below 50 seem to be accurate, while 50 and above seem to use a weighted 2RN formula
+# Given displayed hit x, hit probability is Fates[x]/10000
+Fates = [0, 100, 200, 300, 400, 500, 600, 700, 800, 900, 1000, 1100, 1200, 1300, 1400, 1500, 1600, 1700, 1800, 1900, 2000, 2100, 2200, 2300, 2400, 2500, 2600, 2700, 2800, 2900, 3000, 3100, 3200, 3300, 3400, 3500, 3600, 3700, 3800, 3900, 4000, 4100, 4200, 4300, 4400, 4500, 4600, 4700, 4800, 4900, 5050, 5183, 5317, 5450, 5583, 5717, 5850, 5983, 6117, 6250, 6383, 6517, 6650, 6783, 6917, 7050, 7183, 7317, 7450, 7583, 7717, 7850, 7983, 8117, 8250, 8383, 8512, 8635, 8753, 8866, 8973, 9075, 9172, 9263, 9349, 9430, 9505, 9575, 9640, 9699, 9753, 9802, 9845, 9883, 9916, 9943, 9965, 9982, 9993, 9999, 10000]
+
+# Every game the solver knows about, in the order shown by the GUI dropdown
+gameList = _1RN_games + _2RN_games + ["Fates"]
+
+# Accepted values for the follow-up setting, matching the GUI radio buttons
+followupModes = ["Neither", "Player", "Enemy"]
+
+# Accepted values for the solver backend: exact Fraction arithmetic (the reference), NumPy float64, or exact
+# arithmetic on scaled integers
+backends = ["exact", "float", "integer"]
+
+
+###############################################################################
+############################## Input validation ###############################
+###############################################################################
+
+class Cancelled(Exception):
+    """ Raised by a progress callback to stop a solve that is no longer needed. """
+
+class InputError(ValueError):
+    """ Raised when battle parameters cannot be solved. The title and message mirror the error
+        dialogs shown by the GUI. """
+    def __init__(self, title, message):
+        ValueError.__init__(self, message)
+        self.title = title
+        self.message = message
+
+def validateBattle(game, hit, dmg, crit, hp, followup="Neither"):
+    """ Checks integer battle parameters for problems and raises InputError if the battle can't be
+        solved. hit, dmg, crit and hp are (player, enemy) pairs. """
+    # Error for unknown game
+    if game not in gameList:
+        raise InputError("Selection error", "Select game from the dropdown menu.")
+
+    if followup not in followupModes and not isStrikeOrder(followup):
+        raise InputError("Selection error", 'Follow-up must be one of "Neither", "Player" or "Enemy", or a strike '
+                                            'order such as "PPE".')
+    if len(strikeOrder(followup)) > MAX_STRIKES:
+        raise InputError("Selection error", "Strike orders may have at most %d strikes." % MAX_STRIKES)
+
+    # Hit/Crit out of range errors:
+    invalid = []
+    if hit[0] < 0 or hit[0] > 100: invalid += ["Player Hit"]
+    if hit[1] < 0 or hit[1] > 100: invalid += ["Enemy Hit"]
+    if crit[0] < 0 or crit[0] > 100: invalid += ["Player Crit"]
+    if crit[1] < 0 or crit[1] > 100: invalid += ["Enemy Crit"]
+    if len(invalid) > 0:
+        errorMessage = "Hit and Crit must be values between 0 and 100 (inclusive)."
+        errorMessage += " The following values are out of range:"
+        for field in invalid:
+            errorMessage += "\n-" + field
+        raise InputError("Input error", errorMessage)
+
+    # Dmg/HP out of range errors:
+    if dmg[0] < 0: invalid += ["Player Dmg"]
+    if dmg[1] < 0: invalid += ["Enemy Dmg"]
+    if hp[0] < 0: invalid += ["Player HP"]
+    if hp[1] < 0: invalid += ["Enemy HP"]
+    if len(invalid) > 0:
+        errorMessage = "Dmg and HP values must not be negative. The following values are out of range:"
+        for field in invalid:
+            errorMessage += "\n-" + field
+        raise InputError("Input error", errorMessage)
+
+    # Endless battle error
+    if (hit[0] == 0 or dmg[0] == 0) and (hit[1] == 0 or dmg[1] == 0):
+        raise InputError("Error", "This battle will never end.")
+
+
+###############################################################################
+############################### Instrumentation ###############################
+###############################################################################
+
+# Instrumentation is opt-in: pass an Instrument to solveBattle() or BattleTable(), install one for the whole
+# process with setInstrument(), or set the ARENA_INSTRUMENT environment variable (to "1" or "stderr" for JSON
+# records on stderr, or to a file to append them to) and/or ARENA_PROFILE (a file for cProfile stats). The
+# dynamic programs only report to the active instrument at phase boundaries, through the module-level
+# _probe, so with instrumentation off they pay one global lookup per phase and nothing per cell.
+
+_clock = getattr(time, "perf_counter", time.time)
+
+# Calls of A() and B() per cell in the original dynamic programs
+_callsPerCell = {"DP_1_1": (8, 0), "DP_1_2": (17, 0), "DP_2_1": (23, 12)}
+
+# The instrument measuring the solve in progress, if any
+_probe = None
+
+def recordWriter(target):
+    """ Returns a function that writes records as JSON lines to stderr ("1", "stderr" or "-") or appends
+        them to the file target. """
+    if target in ("1", "stderr", "-"):
+        return lambda record: sys.stderr.write(json.dumps(record, sort_keys=True) + "\n")
+    def write(record):
+        with open(target, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+    return write
+
+class Instrument(object):
+    """ Measures solves and passes one record (a dict) per solve to emit, which defaults to writing JSON
+        lines to stderr. A record holds what was solved, the wall time of the setup, fill and result
+        extraction phases, the number of cells computed, neighbour reads (calls of A() in the original
+        dynamic programs, kernel terms evaluated in the others) and cut checks (calls of B(), or terms with
+        cuts), and the bit lengths of an exact result's numerator and denominator. If profile is a file
+        name, each solve also runs under cProfile and its stats are dumped there; a "%d" in the name is
+        replaced by the number of the solve. """
+    def __init__(self, emit=None, profile=None):
+        self.emit = emit if emit is not None else recordWriter("stderr")
+        self.profile = profile
+        self.solves = 0
+
+    def measure(self, solve, record):
+        """ Calls solve() with this instrument active, emits the completed record and returns the result of
+            solve(). Solves nested inside an instrumented solve are measured as part of it. """
+        global _probe
+        if _probe is not None:
+            return solve()
+        self.record, self.marks = record, {}
+        profiler = None
+        if self.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+        start = _clock()
+        _probe = self
+        try:
+            result = profiler.runcall(solve) if profiler is not None else solve()
+        finally:
+            _probe = None
+        end = _clock()
+
+        self.solves += 1
+        record["seconds"] = end - start
+        # Solves answered without running a dynamic program (from a cache, or trivially) compute no cells
+        for field in ("cells", "neighbourReads", "cutChecks"):
+            record.setdefault(field, 0)
+        if "fill" in self.marks:
+            fill, done = self.marks["fill"], self.marks.get("result", end)
+            record["phases"] = {"setup": fill - start, "fill": done - fill, "result": end - done}
+        value = result.cell(result.m, result.n) if isinstance(result, BattleTable) else result
+        if isinstance(value, AdaptiveResult):
+            value = value.value
+        if isinstance(value, Fraction):
+            record["numeratorBits"] = value.numerator.bit_length()
+            record["denominatorBits"] = value.denominator.bit_length()
+        if profiler is not None:
+            path = self.profile % self.solves if "%d" in self.profile else self.profile
+            profiler.dump_stats(path)
+            record["profile"] = path
+        self.emit(record)
+        return result
+
+    def mark(self, phase):
+        """ Called by the dynamic programs when the "fill" and "result" phases start. """
+        self.marks[phase] = _clock()
+
+    def filled(self, function, cells, reads, cuts, terms=None):
+        """ Called by the dynamic programs after the fill, with the number of cells computed and the
+            neighbour reads and cut checks per cell. """
+        self.record.update({"function": function, "cells": cells, "neighbourReads": cells * reads,
+                            "cutChecks": cells * cuts})
+        if terms is not None:
+            self.record["kernelTerms"] = terms
+
+def instrumentFromEnvironment(environ=os.environ):
+    """ The Instrument described by ARENA_INSTRUMENT and ARENA_PROFILE, or None if neither is set. """
+    target, profile = environ.get("ARENA_INSTRUMENT", ""), environ.get("ARENA_PROFILE", "")
+    if not target and not profile:
+        return None
+    return Instrument(recordWriter(target or "stderr"), profile or None)
+
+_instrument = instrumentFromEnvironment()
+
+def setInstrument(instrument):
+    """ Installs an Instrument (or None) for every solve in this process that isn't given its own, and
+        returns the previous one. """
+    global _instrument
+    previous, _instrument = _instrument, instrument
+    return previous
+
+def _kernelFilled(function, cells, kernel):
+    _probe.filled(function, cells, len(kernel), sum(1 for term in kernel if term[-1]), len(kernel))
+
+
+###############################################################################
+############################## Dynamic programs ###############################
+###############################################################################
+
+# This method will be used to access elements from the DP table without worrying about negative indices.
+# Based on my research and timing tests, passing a large list to a Python method repeatedly won't slow
+# things down - the method won't recreate the list from scratch with each call.
+def A(DP, x, y):
+    return DP[max(x, 0)][max(y, 0)]
+
+# The following function is a hack introduced to deal with the case where the player attacks twice per turn
+def B(x, y):
+    if x <= 0 and y > 0:
+        return 0
+    else:
+        return 1
+
+def initTable(m, n, table=None):
+    """ Creates the initial DP table for the dynamic programs below, extended to cover the given table if
+        there is one. Returns the table along with the size (m0, n0) of the part that is already computed. """
+    if table is None:
+        DP = [x[:] for x in [[Fraction(0)] * (n+1)] * (m+1)]
+        # The values DP[0][j] for j > 0 are already initialized to 0
+        for i in range(m+1):
+            DP[i][0] = Fraction(1)
+        # Initialization of DP table is now complete
+        return DP, 0, 0
+
+    m0, n0 = len(table) - 1, len(table[0]) - 1
+    m, n = max(m, m0), max(n, n0)
+    DP = [row + [Fraction(0)] * (n - n0) for row in table]
+    DP += [[Fraction(1)] + [Fraction(0)] * n for i in range(m - m0)]
+    return DP, m0, n0
+
+# Function that determines the victory probability when player and enemy each attack once per round.
+# All inputs except m and n should be passed as Fraction objects:
+#  m: Number of (non-crit) hits needed to defeat the player
+#  n: Number of hits needed to defeat the enemy
+#  p1: Player true hit rate
+#  p2: Enemy true hit
+#  c1: Player critical hit rate
+#  c2: Enemy crit rate
+# If full is True, the whole table is returned instead of just DP[m][n]. DP[i][j] is the victory probability
+# when the player can take i hits and the enemy can take j hits.
+# If table is given (a full table previously returned for the same rates), its cells are reused and only the
+# cells outside it are computed. The result covers both the given table and (m, n).
+def DP_1_1(m, n, p1, p2, c1, c2, full=False, table=None):
+    DP, m0, n0 = initTable(m, n, table)
+    if _probe is not None:
+        _probe.mark("fill")
+
+    # Compute other values with the recurrence relation, skipping the cells of the given table
+    for i in range(1, len(DP)):
+        for j in range(1 if i > m0 else n0+1, len(DP[0])):
+            r = Fraction(0)
+            r += p1 * (1 - p2) * ( c1 * A(DP, i, j-3) + (1 - c1) * A(DP, i, j-1) )
+            r += (1 - p1) * p2 * ( c2 * A(DP, i-3, j) + (1 - c2) * A(DP, i-1, j) )
+            r += p1 * p2 * ( c1 * c2 * A(DP, i-3, j-3) + c1 * (1 - c2) * A(DP, i-1, j-3) \
+                           + (1 - c1) * c2 * A(DP, i-3, j-1) + (1 - c1) * (1 - c2) * A(DP, i-1, j-1) )
+            DP[i][j] = r / (p1 + p2 - p1 * p2)
+
+    if _probe is not None:
+        _probe.mark("result")
+        _probe.filled("DP_1_1", (len(DP) - 1) * (len(DP[0]) - 1) - m0 * n0, *_callsPerCell["DP_1_1"])
+
+    return DP if full else DP[m][n]
+
+# Function that determines the victory probability when enemy attacks twice per round
+def DP_1_2(m, n, p1, p2, c1, c2, full=False, table=None):
+    DP, m0, n0 = initTable(m, n, table)
+    if _probe is not None:
+        _probe.mark("fill")
+
+    # Compute other values with the recurrence relation, skipping the cells of the given table
+    for i in range(1, len(DP)):
+        for j in range(1 if i > m0 else n0+1, len(DP[0])):
+            r = Fraction(0)
+            r += p1 * (1 - p2) ** 2 * ( c1 * A(DP, i, j-3) + (1 - c1) * A(DP, i, j-1) )
+            r += 2 * (1 - p1) * p2 * (1 - p2) * ( c2 * A(DP, i-3, j) + (1 - c2) * A(DP, i-1, j) )
+            r += 2 * p1 * p2 * (1 - p2) * ( c1 * c2 * A(DP, i-3, j-3) + c1 * (1 - c2) * A(DP, i-1, j-3) \
+                                          + (1 - c1) * c2 * A(DP, i-3, j-1) \
+                                          + (1 - c1) * (1 - c2) * A(DP, i-1, j-1) )
+            r += (1 - p1) * p2 ** 2 * ( c2 ** 2 * A(DP, i-6, j) + 2 * c2 * (1 - c2) * A(DP, i-4, j) \
+                                      + (1 - c2) ** 2 * A(DP, i-2, j) )
+            r += p1 * p2 ** 2 * ( c1 * c2 ** 2 * A(DP, i-6, j-3) + (1 - c1) * c2 ** 2 * A(DP, i-6, j-1) \
+                                + 2 * c1 * c2 * (1 - c2) * A(DP, i-4, j-3) \
+                                + 2 * (1 - c1) * c2 * (1 - c2) * A(DP, i-4, j-1) \
+                                + c1 * (1 - c2) ** 2 * A(DP, i-2, j-3) \
+                                + (1 - c1) * (1 - c2) ** 2 * A(DP, i-2, j-1) )
+            DP[i][j] = r / (p1 + 2 * p2 - 2 * p1 * p2 - p2 ** 2 + p1 * p2 ** 2)
+
+    if _probe is not None:
+        _probe.mark("result")
+        _probe.filled("DP_1_2", (len(DP) - 1) * (len(DP[0]) - 1) - m0 * n0, *_callsPerCell["DP_1_2"])
+
+    return DP if full else DP[m][n]
+
+# Function that determines the victory probability when player attacks twice per round
+def DP_2_1(m, n, p1, p2, c1, c2, full=False, table=None):
+    DP, m0, n0 = initTable(m, n, table)
+    if _probe is not None:
+        _probe.mark("fill")
+
+    # Compute other values with the recurrence relation, skipping the cells of the given table
+    for i in range(1, len(DP)):
+        for j in range(1 if i > m0 else n0+1, len(DP[0])):
+            r = Fraction(0)
+            r += 2 * p1 * (1 - p1) * (1 - p2) * ( c1 * A(DP, i, j-3) + (1 - c1) * A(DP, i, j-1) )
+            r += p1 ** 2 * (1 - p2) * ( c1 ** 2 * A(DP, i, j-6) + 2 * c1 * (1 - c1) * A(DP, i, j-4) \
+                                      + (1 - c1) ** 2 * A(DP, i, j-2) )
+            r += (1 - p1) ** 2 * p2 * ( c2 * A(DP, i-3, j) + (1 - c2) * A(DP, i-1, j) )
+            r += p1 * (1 - p1) * p2 * ( c1 * c2 * A(DP, i-3, j-3) + c1 * (1 - c2) * A(DP, i-1, j-3) \
+                                      + (1 - c1) * c2 * A(DP, i-3, j-1)
+                                      + (1 - c1) * (1 - c2) * A(DP, i-1, j-1) )
+            r += (1 - p1) * p1 * p2 * ( c1 * c2 * B(i-3, j) * A(DP, i-3, j-3) \
+                                      + c1 * (1 - c2) * B(i-1, j) * A(DP, i-1, j-3) \
+                                      + (1 - c1) * c2 * B(i-3, j) * A(DP, i-3, j-1) \
+                                      + (1 - c1) * (1 - c2) * B(i-1, j) * A(DP, i-1, j-1) )
+            r += p1 ** 2 * p2 * c1 * ( (1 - c2) * (1 - c1) * B(i-1, j-3) * A(DP, i-1, j-4) \
+                                     + (1 - c2) * c1 * B(i-1, j-3) * A(DP, i-1, j-6) \
+                                     + c2 * (1 - c1) * B(i-3, j-3) * A(DP, i-3, j-4) \
+                                     + c2 * c1 * B(i-3, j-3) * A(DP, i-3, j-6) )
+            r += p1 ** 2 * p2 * (1 - c1) * ( (1 - c2) * (1 - c1) * B(i-1, j-1) * A(DP, i-1, j-2) \
+                                           + (1 - c2) * c1 * B(i-1, j-1) * A(DP, i-1, j-4) \
+                                           + c2 * (1 - c1) * B(i-3, j-1) * A(DP, i-3, j-2) \
+                                           + c2 * c1 * B(i-3, j-1) * A(DP, i-3, j-4) )
+            DP[i][j] = r / (p2 + 2 * p1 - 2 * p1 * p2 - p1 ** 2 + p1 ** 2 * p2)
+
+    if _probe is not None:
+        _probe.mark("result")
+        _probe.filled("DP_2_1", (len(DP) - 1) * (len(DP[0]) - 1) - m0 * n0, *_callsPerCell["DP_2_1"])
+
+    return DP if full else DP[m][n]
+
+# Dynamic program to call for each follow-up setting
+DP_functions = {"Neither": DP_1_1, "Player": DP_2_1, "Enemy": DP_1_2}
+
+
+###############################################################################
+################################ Round kernels ################################
+###############################################################################
+
+# A round is described by its strike order, a string of "P" (player strikes) and "E" (enemy strikes), so
+# "PE" is DP_1_1, "PEP" is DP_2_1 and "PEE" is DP_1_2. Brave weapons strike twice in a row, e.g. "PPE" for a
+# player with a brave weapon, or "PPEPP" if the player also follows up.
+#
+# compileRound() turns a strike order into a kernel: a list of (weight, di, dj, cuts) terms such that
+# DP[i][j] is the sum of weight * A(DP, i-di, j-dj) over the terms, where the round deals di hits to the
+# player and dj hits to the enemy. The round where every strike misses is folded into the weights, the same
+# way the DP functions divide by the probability that something happens. cuts is a tuple of (x, y) pairs,
+# one for each point in the round where the enemy hits and the player strikes again afterwards: the term is
+# dropped if i - x <= 0 and j - y > 0, i.e. the player was defeated while the enemy was still standing.
+# This is the mid-round kill that B() handles in DP_2_1. When both sides end the round at 0 HP without a cut
+# applying, the enemy fell first, which is what A() gives by clamping.
+
+# Strike order of a round for each follow-up setting
+roundOrders = {"Neither": "PE", "Player": "PEP", "Enemy": "PEE"}
+
+# Longest strike order accepted. Compiling a round enumerates every way its strikes can play out, so the cost
+# grows exponentially with the length: 8 strikes (a brave weapon and a follow-up on both sides) compile in
+# under 0.1 s to a few thousand terms, 10 take about a second and 12 several seconds.
+MAX_STRIKES = 8
+
+def strikeOrder(followup):
+    """ The strike order for a follow-up setting, or followup itself if it is already a strike order. """
+    return roundOrders.get(followup, followup)
+
+def isStrikeOrder(order):
+    """ Checks whether a string is a valid strike order (only "P" and "E", with at least one of each). """
+    return isinstance(order, str) and set(order) == set("PE")
+
+def roundPaths(order, p1, p2, c1, c2):
+    """ Enumerates the ways a round can play out. Returns a list of (probability, points), where points lists
+        (hits dealt to the player, hits dealt to the enemy) so far after each strike that hits. Paths with
+        the same points are merged, and the round where every strike misses has empty points. """
+    p1, p2, c1, c2 = Fraction(p1), Fraction(p2), Fraction(c1), Fraction(c2)
+    paths = strikePaths(order, strikeOutcomes(p1, p2, c1, c2))
+    return [(weight, points) for points, weight in sorted(paths.items()) if weight != 0]
+
+def strikeOutcomes(p1, p2, c1, c2):
+    """ Outcomes of a single strike by each side: (probability, hits dealt) for a miss, a normal hit and a
+        critical hit. The rates may be Fractions, floats or NumPy arrays. """
+    return {"P": [(1 - p1, 0), (p1 * (1 - c1), 1), (p1 * c1, 3)], \
+            "E": [(1 - p2, 0), (p2 * (1 - c2), 1), (p2 * c2, 3)]}
+
+def strikePaths(order, outcomes):
+    """ Returns a dict mapping the points of each way a round can play out (see roundPaths) to its
+        probability. Every outcome is followed, even those with probability 0, so the paths depend only on
+        the strike order. """
+    paths = {(): 1}
+    for striker in order:
+        extended = {}
+        for points, weight in paths.items():
+            di, dj = points[-1] if points else (0, 0)
+            for probability, hits in outcomes[striker]:
+                if hits == 0:
+                    after = points
+                elif striker == "P":
+                    after = points + ((di, dj + hits),)
+                else:
+                    after = points + ((di + hits, dj),)
+                extended[after] = extended.get(after, 0) + weight * probability
+        paths = extended
+    return paths
+
+def roundTerm(points):
+    """ The (di, dj, cuts) of a kernel term for a path through a round (see compileRound). """
+    di, dj = points[-1] if points else (0, 0)
+    # An enemy hit only needs a cut if the player damaged the enemy after it; otherwise clamping already
+    # gives 0. For enemy hits at the same y, the last one (largest x) covers the others.
+    largest = {}
+    for k, (x, y) in enumerate(points):
+        enemyHit = x > (points[k-1][0] if k > 0 else 0)
+        if enemyHit and y < dj:
+            largest[y] = max(x, largest.get(y, 0))
+    return di, dj, tuple(sorted((x, y) for y, x in largest.items()))
+
+def compileRound(order, p1, p2, c1, c2):
+    """ Compiles a strike order into a kernel with exact Fraction weights (see above). Terms with the same
+        (di, dj, cuts) are merged and zero weights are dropped. """
+    merged = {}
+    for weight, points in roundPaths(order, p1, p2, c1, c2):
+        term = roundTerm(points)
+        merged[term] = merged.get(term, Fraction(0)) + weight
+
+    # The round where nothing happens leaves the state unchanged, so it is divided out
+    stay = merged.pop((0, 0, ()), Fraction(0))
+    if stay == 1:
+        raise InputError("Error", "This battle will never end.")
+    return [(weight / (1 - stay), di, dj, cuts) for (di, dj, cuts), weight in sorted(merged.items()) \
+            if weight != 0]
+
+def exactKernel(followup, p1, p2, c1, c2):
+    """ The compiled kernel for a follow-up setting or strike order. """
+    return compileRound(strikeOrder(followup), p1, p2, c1, c2)
+
+def kernelReach(kernel):
+    """ The furthest a kernel reads back along either axis. """
+    return max([1] + [max(di, dj) for weight, di, dj, cuts in kernel])
+
+def DP_round(followup, m, n, p1, p2, c1, c2, full=False, table=None, progress=None):
+    """ Generic exact dynamic program: compiles the round for the given follow-up setting or strike order
+        once, then fills the table with a single loop over the kernel terms, with no coefficient arithmetic
+        per cell. Returns the same Fractions as DP_1_1, DP_2_1 and DP_1_2 for "Neither", "Player" and
+        "Enemy", and takes full and table with the same meaning. If given, progress(done, total) is called
+        after each row of the table; it may raise Cancelled to stop the computation. """
+    kernel = exactKernel(followup, p1, p2, c1, c2)
+    DP, m0, n0 = initTable(m, n, table)
+    if _probe is not None:
+        _probe.mark("fill")
+
+    for i in range(1, len(DP)):
+        row = DP[i]
+        for j in range(1 if i > m0 else n0+1, len(row)):
+            r = Fraction(0)
+            for weight, di, dj, cuts in kernel:
+                if cuts and any(i <= x and j > y for x, y in cuts):
+                    continue
+                if j <= dj:
+                    # Clamped to DP[max(i - di, 0)][0] = 1
+                    r += weight
+                elif i > di:
+                    r += weight * DP[i-di][j-dj]
+                # Otherwise clamped to DP[0][j - dj] = 0
+            row[j] = r
+        if progress is not None:
+            progress(i, len(DP) - 1)
+    if _probe is not None:
+        _probe.mark("result")
+        _kernelFilled("DP_round", (len(DP) - 1) * (len(DP[0]) - 1) - m0 * n0, kernel)
+
+    return DP if full else DP[m][n]
+
+
+###############################################################################
+############################### Float64 backend ###############################
+###############################################################################
+
+# The float backend evaluates the compiled round kernels in NumPy float64.
+
+# Float kernels compiled so far, by strike order and rates, most recently used last
+_floatKernels = OrderedDict()
+FLOAT_KERNELS = 256
+
+def floatKernel(followup, p1, p2, c1, c2):
+    """ exactKernel() with the weights converted to floats. Kernels are kept for the last FLOAT_KERNELS rate
+        keys, so callers share the returned list and must not modify it. """
+    key = (strikeOrder(followup), Fraction(p1), Fraction(p2), Fraction(c1), Fraction(c2))
+    terms = _floatKernels.pop(key, None)
+    if terms is None:
+        terms = [(float(weight), di, dj, cuts) for weight, di, dj, cuts in exactKernel(followup, p1, p2, c1, c2)]
+        if len(_floatKernels) >= FLOAT_KERNELS:
+            _floatKernels.popitem(last=False)
+    _floatKernels[key] = terms
+    return terms
+
+def _fillDiagonal(S, pad, terms, d, lo, hi):
+    """ Computes the cells (i, d - i) for lo <= i <= hi of anti-diagonal d of the skewed table S. """
+    diagonal = np.zeros(hi - lo + 1)
+    for weight, di, dj, cuts in terms:
+        src = S[d - di - dj + 2*pad, lo - di + pad : hi - di + pad + 1]
+        for x, y in cuts:
+            if lo <= x:
+                # The cut drops the term when i - x <= 0 and j - y > 0, which only happens at the first few
+                # cells of the anti-diagonal
+                i = np.arange(lo, min(hi, x) + 1)
+                src = src.copy()
+                src[:len(i)] *= (d - i - y <= 0)
+        diagonal += weight * src
+    S[d + 2*pad, lo + pad : hi + pad + 1] = diagonal
+
+def floatTable(followup, m, n, p1, p2, c1, c2, table=None, progress=None):
+    """ Fills the DP table in float64 and returns (S, pad), the table in skewed form: DP[i][j] is stored at
+        S[i + j + 2*pad][i + pad], where pad is the furthest the round reads back. Every neighbour of a cell
+        lies on an earlier anti-diagonal, so each anti-diagonal is computed in one vectorized step, and in
+        skewed form each neighbour read is a contiguous slice of an earlier row of S. The padding holds the
+        values that A() produces by clamping negative indices (1 where j <= 0, otherwise 0 where i <= 0).
+        If table is given (a full float table for the same rates), its cells are copied in and only the
+        cells outside it are computed. progress works as in DP_round, counting anti-diagonals. """
+    if np is None:
+        raise ImportError("The float backend requires NumPy.")
+    terms = floatKernel(followup, p1, p2, c1, c2)
+    pad = kernelReach(terms)
+
+    m0, n0 = 0, 0
+    if table is not None:
+        m0, n0 = table.shape[0] - 1, table.shape[1] - 1
+        m, n = max(m, m0), max(n, n0)
+
+    rows = np.arange(m + n + 2*pad + 1) - 2*pad
+    cols = np.arange(m + pad + 1) - pad
+    S = (rows[:, None] - cols[None, :] <= 0).astype(np.float64)
+    if table is not None:
+        i, j = np.indices(table.shape)
+        S[i + j + 2*pad, i + pad] = table
+    if _probe is not None:
+        _probe.mark("fill")
+
+    for d in range(2, m + n + 1):
+        lo, hi = max(1, d - n), min(m, d - 1)
+        # On anti-diagonal d, the cells with j > n0 come first, then the known cells, then the cells with
+        # i > m0. Without a given table, the first run covers the whole anti-diagonal.
+        if lo <= min(hi, d - n0 - 1):
+            _fillDiagonal(S, pad, terms, d, lo, min(hi, d - n0 - 1))
+        if max(lo, m0 + 1, d - n0) <= hi:
+            _fillDiagonal(S, pad, terms, d, max(lo, m0 + 1, d - n0), hi)
+        if progress is not None:
+            progress(d - 1, m + n - 1)
+    if _probe is not None:
+        _probe.mark("result")
+        _kernelFilled("DP_float", m * n - m0 * n0, terms)
+
+    return S, pad
+
+def DP_float(followup, m, n, p1, p2, c1, c2, full=False, table=None, progress=None):
+    """ float64 counterpart of DP_round. Agrees with the exact result to within a few
+        units in the last place for typical arena tables (see README), and is orders of magnitude faster on
+        large tables. If full is True, the whole table is returned as an array; table and progress work as
+        they do for DP_round. """
+    S, pad = floatTable(followup, m, n, p1, p2, c1, c2, table, progress)
+    if full:
+        shape = (m + 1, n + 1) if table is None else (max(m + 1, table.shape[0]), max(n + 1, table.shape[1]))
+        i, j = np.indices(shape)
+        return S[i + j + 2*pad, i + pad]
+    return float(S[m + n + 2*pad, m + pad])
+
+
+# Unit roundoff of float64, and a bound on the absolute error of any operation that underflows
+_UNIT = 2.0 ** -53
+_UNDERFLOW = 2.0 ** -1074
+
+def floatErrorBound(terms, m, n):
+    """ A rigorous bound on |DP_float(...) - DP[m][n]| for the float kernel terms, which also holds for the
+        same cell of floatWindow() and of a float table that was extended. The weights are correctly rounded
+        from the exact kernel, their exact values sum to at most 1 and every cell lies in [0, 1]. So a cell
+        computed from k = len(terms) products picks up at most gamma(k + 1) = (k + 1)u / (1 - (k + 1)u) of
+        new error, and carries the errors of its neighbours scaled by at most 1 + gamma(k + 1). The
+        neighbours lie on earlier anti-diagonals and the padding is exact, so over the m + n - 1
+        anti-diagonals the error is at most gamma((m + n - 1)(k + 1)), plus a little for underflow. Returns
+        infinity when that bound is meaningless. """
+    if m == 0 or n == 0:
+        return 0.0
+    steps = (m + n - 1) * (len(terms) + 1)
+    if steps * _UNIT >= 0.5:
+        return float("inf")
+    # Evaluated in float64 itself, so the bound is widened slightly to stay an upper bound
+    return (steps * _UNIT / (1 - steps * _UNIT) + steps * _UNDERFLOW) * (1 + 1e-12)
+
+
+###############################################################################
+############################### Integer backend ###############################
+###############################################################################
+
+# The integer backend is an exact alternative to the Fraction dynamic programs. With all weights of the
+# recurrence written over a common denominator Q (the lcm of their denominators), every cell satisfies
+# DP[i][j] = S[i][j] / Q^(i+j) for an integer S[i][j], since each neighbour lies at least one step closer to
+# (0, 0). The table of S values is filled with plain int arithmetic, and the only gcd normalization happens
+# when the result is turned back into a Fraction.
+
+def integerKernel(followup, p1, p2, c1, c2):
+    """ Returns (Q, terms), where terms is a list of (W, di, dj, cuts) with integer weights W such that the
+        kernel weights are W / Q. """
+    kernel = exactKernel(followup, p1, p2, c1, c2)
+    Q = 1
+    for weight, di, dj, cuts in kernel:
+        Q = Q * weight.denominator // gcd(Q, weight.denominator)
+    return Q, [(int(weight * Q), di, dj, cuts) for weight, di, dj, cuts in kernel]
+
+def DP_integer(followup, m, n, p1, p2, c1, c2, full=False, table=None, progress=None):
+    """ DP_round on scaled integers. Returns the same Fractions, and takes full, table and progress with the
+        same meaning. """
+    if table is not None:
+        # Back to the scaled form of integerTable()
+        Q = integerKernel(followup, p1, p2, c1, c2)[0]
+        table = [[x.numerator * (Q ** (i + j) // x.denominator) if i > 0 and j > 0 else int(x) \
+                  for j, x in enumerate(row)] for i, row in enumerate(table)]
+    Q, S = integerTable(followup, m, n, p1, p2, c1, c2, table, progress)
+    if full:
+        return [[scaledCell(Q, S, i, j) for j in range(len(S[0]))] for i in range(len(S))]
+    return scaledCell(Q, S, m, n)
+
+def scaledCell(Q, S, i, j):
+    """ DP[i][j] as a Fraction, from a table of integerTable(). """
+    if i == 0 or j == 0:
+        return Fraction(S[i][j])
+    return Fraction(S[i][j], Q ** (i + j))
+
+def integerTable(followup, m, n, p1, p2, c1, c2, table=None, progress=None):
+    """ The table of DP_integer() in its scaled form: returns (Q, S), where DP[i][j] = S[i][j] / Q^(i + j)
+        for i, j > 0 and S[i][0] = 1, S[0][j] = 0 (see scaledCell()). Converting every cell to a Fraction
+        costs several times the fill, so BattleTable keeps this form. table is an earlier S for the same
+        rates, which is extended; progress works as for DP_round. """
+    Q, kernel = integerKernel(followup, p1, p2, c1, c2)
+    m0, n0 = 0, 0
+    if table is not None:
+        m0, n0 = len(table) - 1, len(table[0]) - 1
+    M, N = max(m, m0), max(n, n0)
+    # Powers of Q up to the largest of i + j and di + dj
+    power = [1]
+    for k in range(max(M + N, 2 * kernelReach(kernel))):
+        power.append(power[-1] * Q)
+    # A neighbour (i - di, j - dj) inside the table contributes W * Q^(di + dj - 1) * S[i - di][j - dj]
+    terms = [(W, W * power[di + dj - 1], di, dj, cuts) for W, di, dj, cuts in kernel]
+
+    if table is None:
+        S = [[1] + [0] * N for i in range(M + 1)]
+    else:
+        S = [row + [0] * (N - n0) for row in table] + [[1] + [0] * N for i in range(M - m0)]
+    if _probe is not None:
+        _probe.mark("fill")
+
+    for i in range(1, M + 1):
+        row = S[i]
+        for j in range(1 if i > m0 else n0 + 1, N + 1):
+            r = 0
+            for W, scaled, di, dj, cuts in terms:
+                if cuts and any(i <= x and j > y for x, y in cuts):
+                    continue
+                x, y = i - di, j - dj
+                if y <= 0:
+                    # Clamped to DP[max(x, 0)][0] = 1
+                    r += W * power[i + j - 1]
+                elif x > 0:
+                    r += scaled * S[x][y]
+                # Otherwise clamped to DP[0][y] = 0
+            row[j] = r
+        if progress is not None:
+            progress(i, M)
+    if _probe is not None:
+        _probe.mark("result")
+        _kernelFilled("DP_integer", M * N - m0 * n0, kernel)
+    return Q, S
+
+
+###############################################################################
+############################### Rolling window ################################
+###############################################################################
+
+# When only DP[m][n] is needed, most of the table can be thrown away as it is filled: a cell reads back at
+# most kernelReach() rows, so DP_window keeps a ring of that many rows plus the current one (7 rows for
+# "Enemy" with crits) and memory grows with n instead of m * n. The exact backends store the rows as lists of
+# ints (integer) or Fractions (exact); the float backend keeps a ring of anti-diagonals as NumPy arrays.
+
+def _windowRows(terms, m, n, Q, progress=None):
+    """ Fills the table a row at a time in the scaled form of DP_integer, keeping only a ring of rows, and
+        returns S[m][n]. terms is a kernel over the common denominator Q; with Q = 1 and Fraction weights,
+        S is the table of DP itself. """
+    reach = kernelReach(terms)
+    power = [1]
+    for k in range(2 * reach):
+        power.append(power[-1] * Q)
+    terms = [(W, W * power[di + dj - 1], di, dj, cuts) for W, di, dj, cuts in terms]
+
+    ring = [None] * (reach + 1)
+    ring[0] = [1] + [0] * n
+    # Q^(i - 1) for the row being filled
+    base = 1
+    for i in range(1, m + 1):
+        row = [1] + [0] * n
+        # The row each term reads from (this row for di = 0), or None where it is clamped to row 0, which
+        # holds 0 for j > 0
+        sources = [(row if di == 0 else ring[(i - di) % len(ring)]) if i > di else None \
+                   for W, scaled, di, dj, cuts in terms]
+        for j in range(1, n + 1):
+            r = 0
+            for (W, scaled, di, dj, cuts), source in zip(terms, sources):
+                if cuts and any(i <= x and j > y for x, y in cuts):
+                    continue
+                if j <= dj:
+                    # Clamped to DP[max(i - di, 0)][0] = 1, i.e. W * Q^(i+j-1)
+                    r += W * base * power[j]
+                elif source is not None:
+                    r += scaled * source[j - dj]
+            row[j] = r
+        ring[i % len(ring)] = row
+        base *= Q
+        if progress is not None:
+            progress(i, m)
+    return ring[m % len(ring)][n]
+
+def floatWindow(terms, m, n, size=None, progress=None):
+    """ Fills the table in float64 one anti-diagonal at a time, as floatTable() does, but keeps only the
+        anti-diagonals the round reads back over, and returns DP[m][n]. If size is given, the weights are
+        arrays of that length and every cell holds one value per grid point (see sweep.py), and the result
+        is such an array. progress works as in floatTable(). """
+    if np is None:
+        raise ImportError("The float backend requires NumPy.")
+    pad = kernelReach(terms)
+    # Index that lines a per-cell vector up with the cells of a slot
+    cells = (slice(None),) if size is None else (slice(None), None)
+
+    # Anti-diagonal d is kept in slot d % window, with cell i at row i + pad. The slots start out as the
+    # values A() produces by clamping: 1 where j = d - i <= 0, otherwise 0.
+    window = 2*pad + 1
+    cols = np.arange(m + pad + 1) - pad
+    slots = np.zeros((window, m + pad + 1) + (() if size is None else (size,)))
+    for d in range(2 - 2*pad, 2):
+        slots[d % window] = (d - cols <= 0)[cells]
+
+    for d in range(2, m + n + 1):
+        lo, hi = max(1, d - n), min(m, d - 1)
+        diagonal = np.zeros((hi - lo + 1,) + slots.shape[2:])
+        for weight, di, dj, cuts in terms:
+            src = slots[(d - di - dj) % window, lo - di + pad : hi - di + pad + 1]
+            for x, y in cuts:
+                if lo <= x:
+                    # As in _fillDiagonal, the cut only drops the term at the first few cells
+                    i = np.arange(lo, min(hi, x) + 1)
+                    src = src.copy()
+                    src[:len(i)] *= (d - i - y <= 0)[cells]
+            diagonal += weight * src
+        # Besides the computed cells, later anti-diagonals only read the pad cells on either side of them:
+        # 0 where i <= 0, and 1 where j <= 0 just past hi (when hi = d - 1)
+        slot = slots[d % window]
+        slot[:pad + 1] = 0
+        slot[lo + pad : hi + pad + 1] = diagonal
+        slot[hi + pad + 1 : hi + 2*pad + 1] = 1
+        if progress is not None:
+            progress(d - 1, m + n - 1)
+
+    return slots[(m + n) % window, m + pad]
+
+def DP_window(followup, m, n, p1, p2, c1, c2, backend="exact", progress=None):
+    """ DP[m][n] for the given backend, computed with memory that grows with n (exact backends) or m (float)
+        instead of m * n. Returns the same value as DP_round, DP_integer or DP_float. progress(done, total)
+        is called after each row (anti-diagonal for float) and may raise Cancelled. """
+    if backend == "float":
+        terms = floatKernel(followup, p1, p2, c1, c2)
+    elif backend == "integer":
+        Q, terms = integerKernel(followup, p1, p2, c1, c2)
+    else:
+        Q, terms = 1, exactKernel(followup, p1, p2, c1, c2)
+    if _probe is not None:
+        _probe.mark("fill")
+
+    if backend == "float":
+        result = float(floatWindow(terms, m, n, progress=progress))
+    else:
+        S = _windowRows(terms, m, n, Q, progress)
+        result = Fraction(S) if m == 0 or n == 0 else Fraction(S, Q ** (m + n))
+    if _probe is not None:
+        _probe.mark("result")
+        _kernelFilled("DP_window", m * n, terms)
+    return result
+
+
+###############################################################################
+################################ Race fast path ###############################
+###############################################################################
+
+# With thousands of hits on each side, even the float table is slow. Strike by strike, though, a battle is a
+# race: each side's strikes deal damage independently of the other side's. Let S be the number of player
+# strikes it takes to bring the enemy down, and R the number of enemy strikes it takes to bring the player
+# down. The player wins exactly when the enemy has struck fewer than R times before the player's strike S:
+#
+#     P(victory) = sum over s of P(S = s) * P(R > e(s)),
+#
+# where e(s) is the number of enemy strikes before the player's strike s, which only depends on the strike
+# order. Without crits, S is negative binomial: the number of strikes needed to land n hits. With crits,
+# the number of hits H needed is spread between n/3 and n, and S is a mixture of negative binomials over H.
+# Every distribution is concentrated within a few standard deviations of its mean, a window about
+# sqrt(n)/p strikes wide, so DP_race evaluates them on those windows in log space instead of filling the
+# m x n table. The sums only add positive terms; the error comes from the log gamma values and is about
+# 1e-12 relative for hundreds of hits, growing to 1e-9 for a million. Mass beyond the windows is dropped, so
+# probabilities below about 1e-25 lose their relative accuracy (the absolute error stays far below 1e-15).
+
+# Smallest table (in cells) for which solveBattle() tries the race with the float backend, and the cost of
+# one race term, in float table cells
+RACE_CELLS = 10**6
+RACE_TERM_COST = 16
+# Standard deviations kept on either side of a distribution's mean
+_SPREAD = 12
+
+def _lgamma(values):
+    """ math.lgamma of each element of an array. """
+    return np.frompyfunc(math.lgamma, 1, 1)(values).astype(np.float64)
+
+def _hitWindow(n, c):
+    """ The range of numbers of hits holding practically all the mass of H. """
+    if c == 0:
+        return n, n
+    if c == 1:
+        return -(-n // 3), -(-n // 3)
+    mean = n / (1 + 2*c)
+    spread = _SPREAD * 2 * math.sqrt(mean * c * (1 - c)) / (1 + 2*c) + 3
+    return max(-(-n // 3), int(mean - spread)), min(n, int(mean + spread) + 1)
+
+def _hitsNeeded(n, c):
+    """ Distribution of the number of hits it takes to deal n hits of damage at crit rate c, where a crit
+        deals 3. Returns (first, pmf) with P(H = first + k) = pmf[k]. """
+    low, high = _hitWindow(n, c)
+    if c == 0 or c == 1:
+        return low, np.ones(1)
+    h = np.arange(low, high + 1)
+
+    # H = h when the first h - 1 hits deal n - t hits of damage for t = 1, 2 or 3, which takes (n - t - h + 1)/2
+    # crits among them, and the h-th hit finishes the job, which takes a crit unless t = 1
+    pmf = np.zeros(len(h))
+    for t, finish in ((1, 1.0), (2, c), (3, c)):
+        twice = n - t - (h - 1)
+        valid = (twice >= 0) & (twice % 2 == 0) & (twice // 2 <= h - 1)
+        k, trials = twice[valid] // 2, h[valid] - 1
+        logp = _lgamma(trials + 1) - _lgamma(k + 1) - _lgamma(trials - k + 1) + k * math.log(c) \
+               + (trials - k) * math.log1p(-c)
+        pmf[valid] += finish * np.exp(logp)
+    return int(h[0]), pmf
+
+def _strikeWindow(first, last, p):
+    """ The range of strike counts holding practically all the mass of S for H between first and last. """
+    low = first / p - _SPREAD * math.sqrt(first * (1 - p)) / p
+    high = last / p + _SPREAD * math.sqrt(last * (1 - p)) / p + 5 * _SPREAD / p
+    return max(first, int(low)), int(high) + 1
+
+def _strikesNeeded(n, p, c):
+    """ Distribution of the number of strikes it takes to deal n hits of damage at hit rate p and crit rate
+        c, as (first, pmf) like _hitsNeeded(). """
+    first, hits = _hitsNeeded(n, c)
+    if p == 1:
+        return first, hits / hits.sum()
+    sLow, sHigh = _strikeWindow(first, first + len(hits) - 1, p)
+    s = np.arange(sLow, sHigh + 1)
+    # log (s - 1)! and log x! for the numbers of misses x that occur in the window
+    logS = _lgamma(s)
+    missLow = max(0, sLow - (first + len(hits) - 1))
+    logMiss = _lgamma(np.arange(missLow, sHigh - first + 1) + 1.0)
+
+    pmf = np.zeros(len(s))
+    peak = hits.max()
+    for k, weight in enumerate(hits):
+        h = first + k
+        if weight < 1e-20 * peak or h > sHigh:
+            continue
+        # P(S = s | H = h) = C(s-1, h-1) p^h (1-p)^(s-h) for s >= h
+        start = max(h, sLow)
+        misses = np.arange(start - h, sHigh - h + 1)
+        logp = logS[start - sLow:] - math.lgamma(h) - logMiss[misses - missLow] + h * math.log(p) \
+               + misses * math.log1p(-p)
+        pmf[start - sLow:] += weight * np.exp(logp)
+    return sLow, pmf / pmf.sum()
+
+def raceWork(m, n, p1, p2, c1, c2):
+    """ Rough cost of DP_race in float table cells, for deciding whether it beats the table. """
+    work = 0
+    for hits, p, c in ((n, float(p1), float(c1)), (m, float(p2), float(c2))):
+        first, last = _hitWindow(hits, c)
+        low, high = _strikeWindow(first, last, p) if p < 1 else (first, last)
+        work += (last - first + 1) * (high - low + 1)
+    return RACE_TERM_COST * work
+
+def DP_race(followup, m, n, p1, p2, c1, c2):
+    """ Float victory probability DP[m][n] for a follow-up setting or strike order, computed as a race
+        between the two sides (see above) in time that grows like sqrt(m) + sqrt(n) rather than m * n.
+        Agrees with DP_float to about 1e-12 relative for typical rates. """
+    if np is None:
+        raise ImportError("The race fast path requires NumPy.")
+    if n == 0:
+        return 1.0
+    if m == 0 or p1 == 0:
+        return 0.0
+    if p2 == 0:
+        return 1.0
+    order = strikeOrder(followup)
+    if _probe is not None:
+        _probe.mark("fill")
+    sFirst, S = _strikesNeeded(n, float(p1), float(c1))
+    rFirst, R = _strikesNeeded(m, float(p2), float(c2))
+
+    # tail[k] = P(R >= rFirst + k), summed from the far end so small tails keep their precision
+    tail = np.append(np.cumsum(R[::-1])[::-1], 0.0)
+    # Enemy strikes before the player's strike s: b per full round, plus those before it in its round
+    s = np.arange(sFirst, sFirst + len(S))
+    a, b = order.count("P"), order.count("E")
+    before = np.array([order[:k].count("E") for k in range(len(order)) if order[k] == "P"])
+    e = (s - 1) // a * b + before[(s - 1) % a]
+    result = float(np.dot(S, tail[np.clip(e + 1 - rFirst, 0, len(R))]))
+    if _probe is not None:
+        _probe.mark("result")
+        _probe.filled("DP_race", 0, 0, 0)
+        _probe.record["raceTerms"] = len(S) + len(R)
+    return min(result, 1.0)
+
+
+###############################################################################
+############################# Outcome distribution ############################
+###############################################################################
+
+# The dynamic programs above work backwards from the end of the battle and give the victory probability for
+# every starting state. To get more than that from one solve, DP_outcome runs forwards from the single
+# starting state (m, n): it pushes the probability of reaching each state at the start of a round through
+# the round's outcomes, in order of decreasing i and j, and collects the probability that ends in each
+# absorbing state. It also carries the first and second moments of the number of rounds played so far, so
+# the expected battle length and its variance come out of the same sweep. The number of rounds spent in a
+# state is geometric (every round where nothing happens is repeated), with mean 1/q and second moment
+# (2 - q)/q^2, where q is the probability that something happens.
+
+class BattleOutcome(object):
+    """ Outcome distribution of a battle. victory is the player's victory probability, playerRemaining maps
+        the number of hits the player can still take when the enemy falls to its probability, enemyRemaining
+        does the same for the enemy when the player falls, and expectedRounds and roundsVariance describe
+        the number of rounds fought. Values are Fractions or floats, depending on how it was solved. """
+    def __init__(self, victory, playerRemaining, enemyRemaining, expectedRounds, roundsVariance):
+        self.victory = victory
+        self.playerRemaining = playerRemaining
+        self.enemyRemaining = enemyRemaining
+        self.expectedRounds = expectedRounds
+        self.roundsVariance = roundsVariance
+
+    def remainingHP(self, hp1, dmg2, hp2, dmg1):
+        """ Converts playerRemaining and enemyRemaining into remaining HP distributions, given the HP and
+            Dmg values the hit counts were computed from. Returns (player HP on victory, enemy HP on defeat).
+            A side that takes no damage keeps its full HP. """
+        player = dict((hp1 - (hitsToKill(hp1, dmg2) - i) * dmg2 if dmg2 > 0 else hp1, x) \
+                      for i, x in self.playerRemaining.items())
+        enemy = dict((hp2 - (hitsToKill(hp2, dmg1) - j) * dmg1 if dmg1 > 0 else hp2, x) \
+                     for j, x in self.enemyRemaining.items())
+        return player, enemy
+
+def _roundTransitions(paths, i, j):
+    """ Where a round starting at (i, j) ends up, following each path strike by strike: a list of
+        (weight, result, k), where result is "win" with k the player's remaining hits, "loss" with k the
+        enemy's remaining hits, or "move" with k the next state. """
+    transitions = []
+    for weight, points in paths:
+        for x, y in points:
+            if y >= j:
+                transitions.append((weight, "win", i - x))
+                break
+            if x >= i:
+                transitions.append((weight, "loss", j - y))
+                break
+        else:
+            transitions.append((weight, "move", (i - points[-1][0], j - points[-1][1])))
+    return transitions
+
+def DP_outcome(followup, m, n, p1, p2, c1, c2, exact=True):
+    """ Solves the full outcome distribution of a battle starting at (m, n) in one forward sweep (see above),
+        in exact Fraction arithmetic or in floats. Returns a BattleOutcome. """
+    zero = Fraction(0) if exact else 0.0
+    if n == 0 or m == 0:
+        # The battle is over before it starts: clamping gives the victory to the player if n == 0
+        return BattleOutcome(zero + (n == 0), {m: zero + 1} if n == 0 else {}, \
+                             {} if n == 0 else {n: zero + 1}, zero, zero)
+
+    paths = roundPaths(strikeOrder(followup), p1, p2, c1, c2)
+    stay = sum((weight for weight, points in paths if not points), Fraction(0))
+    if stay == 1:
+        raise InputError("Error", "This battle will never end.")
+    q = 1 - stay
+    # Outcomes of a round that changes something, as probabilities conditional on that
+    paths = [(weight / q if exact else float(weight / q), points) for weight, points in paths if points]
+    meanStay, squareStay = (1 / q, (2 - q) / q ** 2) if exact else (float(1 / q), float((2 - q) / q ** 2))
+    # Away from the edges of the table nobody can fall this round, so the transitions only depend on the
+    # total hits dealt
+    reachI = max(points[-1][0] for weight, points in paths)
+    reachJ = max(points[-1][1] for weight, points in paths)
+    interior = {}
+    for weight, points in paths:
+        interior[points[-1]] = interior.get(points[-1], zero) + weight
+    interior = [(weight, di, dj) for (di, dj), weight in interior.items()]
+
+    # Probability of reaching each state, and the first and second moments of rounds played on arrival
+    mass = [[zero] * (n + 1) for i in range(m + 1)]
+    first = [[zero] * (n + 1) for i in range(m + 1)]
+    second = [[zero] * (n + 1) for i in range(m + 1)]
+    mass[m][n] = zero + 1
+    playerRemaining, enemyRemaining = {}, {}
+    meanRounds, squareRounds = zero, zero
+
+    for i in range(m, 0, -1):
+        for j in range(n, 0, -1):
+            w = mass[i][j]
+            if w == 0:
+                continue
+            # Moments after the rounds spent in this state
+            f = first[i][j] + w * meanStay
+            g = second[i][j] + 2 * first[i][j] * meanStay + w * squareStay
+            if i > reachI and j > reachJ:
+                for weight, di, dj in interior:
+                    mass[i-di][j-dj] += weight * w
+                    first[i-di][j-dj] += weight * f
+                    second[i-di][j-dj] += weight * g
+                continue
+            for weight, result, k in _roundTransitions(paths, i, j):
+                if result == "move":
+                    mass[k[0]][k[1]] += weight * w
+                    first[k[0]][k[1]] += weight * f
+                    second[k[0]][k[1]] += weight * g
+                    continue
+                if result == "win":
+                    playerRemaining[k] = playerRemaining.get(k, zero) + weight * w
+                else:
+                    enemyRemaining[k] = enemyRemaining.get(k, zero) + weight * w
+                meanRounds += weight * f
+                squareRounds += weight * g
+
+    return BattleOutcome(sum(playerRemaining.values(), zero), playerRemaining, enemyRemaining, meanRounds, \
+                         squareRounds - meanRounds ** 2)
+
+
+###############################################################################
+################################# Solver API ##################################
+###############################################################################
+
+def trueHit(game, hit):
+    """ Converts a displayed hit rate into the true hit probability (as a Fraction) for the given game. """
+    if game in _1RN_games:
+        return Fraction(_1RN[hit], 100)
+    elif game in _2RN_games:
+        return Fraction(_2RN[hit], 10000)
+    else:
+        return Fraction(Fates[hit], 10000)
+
+def hitsToKill(hp, dmg):
+    """ Number of (non-crit) hits needed to take hp down to 0, i.e. ceil(hp/dmg) for positive dmg. """
+    return -(-hp // dmg)
+
+def solveBattle(game, hit, dmg, crit, hp, followup="Neither", backend="exact", cache=None, progress=None, \
+                instrument=None, window=False):
+    """ Returns the player's victory probability. hit, dmg, crit and hp are (player, enemy) pairs of
+        integers, followup is "Neither", "Player" or "Enemy", or a strike order (see compileRound). The
+        "exact" and "integer" backends return the same Fraction and the "float" backend (which needs NumPy)
+        returns a float. If a TableCache is given, the DP table is looked up in (and added to) the cache.
+        progress(done, total) is called as the table is filled, and may raise Cancelled to stop the solve.
+        The solve is measured by instrument if one is given, and otherwise by the process-wide Instrument
+        if one is installed (see setInstrument). If window is True and no cache is given, only a few rows of
+        the table are kept in memory at a time (see DP_window). Without a cache, float solves with at least
+        RACE_CELLS cells use the race fast path (see DP_race) when it is cheaper. Raises InputError if the
+        parameters are invalid. """
+    instrument = instrument if instrument is not None else _instrument
+    if instrument is not None:
+        record = {"solve": "solveBattle", "game": game, "hit": list(hit), "dmg": list(dmg), "crit": list(crit),
+                  "hp": list(hp), "followup": followup, "backend": backend, "cache": cache is not None,
+                  "window": window}
+        return instrument.measure(lambda: _solveBattle(game, hit, dmg, crit, hp, followup, backend, cache, \
+                                                       progress, window), record)
+    return _solveBattle(game, hit, dmg, crit, hp, followup, backend, cache, progress, window)
+
+def _solveBattle(game, hit, dmg, crit, hp, followup, backend, cache, progress, window):
+    validateBattle(game, hit, dmg, crit, hp, followup)
+    if backend not in backends:
+        raise InputError("Selection error", 'Backend must be one of "exact", "float" or "integer".')
+
+    # If the player can't hit/damage the enemy, then the enemy will win
+    if hit[0] == 0 or dmg[0] == 0:
+        return 0.0 if backend == "float" else Fraction(0)
+    # ...and likewise if the enemy can't hit/damage
+    if hit[1] == 0 or dmg[1] == 0:
+        return 1.0 if backend == "float" else Fraction(1)
+
+    # Having checked the cases above, we won't encounter any division by 0 errors
+    m, n = hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0])
+
+    # Construct the other inputs to the dynamic program as fractions
+    p1, p2 = trueHit(game, hit[0]), trueHit(game, hit[1])
+    c1, c2 = Fraction(crit[0], 100), Fraction(crit[1], 100)
+
+    if cache is not None:
+        return cache.get(followup, m, n, p1, p2, c1, c2, backend, progress).cell(m, n)
+    # Large float solves are a race unless the rates are so low that the race's windows outgrow the table
+    if backend == "float" and m * n >= RACE_CELLS and raceWork(m, n, p1, p2, c1, c2) < m * n:
+        return DP_race(followup, m, n, p1, p2, c1, c2)
+    if window:
+        return DP_window(followup, m, n, p1, p2, c1, c2, backend, progress)
+
+    # Call the appropriate dynamic program depending on which combatant, if either, can follow-up
+    if backend == "float":
+        return DP_float(followup, m, n, p1, p2, c1, c2, progress=progress)
+    elif backend == "integer":
+        return DP_integer(followup, m, n, p1, p2, c1, c2, progress=progress)
+    elif followup in DP_functions and progress is None:
+        return DP_functions[followup](m, n, p1, p2, c1, c2)
+    return DP_round(followup, m, n, p1, p2, c1, c2, progress=progress)
+
+
+class AdaptiveResult(object):
+    """ Result of solveAdaptive(). value is the victory probability, bound a rigorous bound on its absolute
+        error, and path "float" if the float backend answered or "exact" if the exact one did (value is
+        then a Fraction and bound is 0). """
+    def __init__(self, value, bound, path):
+        self.value = value
+        self.bound = bound
+        self.path = path
+
+    def percent(self):
+        return float(100 * self.value)
+
+def solveAdaptive(game, hit, dmg, crit, hp, followup="Neither", tolerance=1e-9, exact=False, cache=None, \
+                  progress=None, instrument=None):
+    """ Solves in float64 when floatErrorBound() shows the result is within tolerance of the exact
+        probability, and with the exact integer backend otherwise, or when exact is True. Returns an
+        AdaptiveResult recording which path answered. The bound depends only on the table size and kernel,
+        so the path is chosen before solving. cache, progress and instrument work as in solveBattle(), and
+        instrument records include the path and bound. Raises InputError if the parameters are invalid. """
+    instrument = instrument if instrument is not None else _instrument
+    if instrument is not None:
+        record = {"solve": "solveAdaptive", "game": game, "hit": list(hit), "dmg": list(dmg), "crit": list(crit),
+                  "hp": list(hp), "followup": followup, "tolerance": tolerance, "exact": exact,
+                  "cache": cache is not None}
+        return instrument.measure(lambda: _solveAdaptive(game, hit, dmg, crit, hp, followup, tolerance, exact, \
+                                                         cache, progress, record), record)
+    return _solveAdaptive(game, hit, dmg, crit, hp, followup, tolerance, exact, cache, progress)
+
+def _solveAdaptive(game, hit, dmg, crit, hp, followup, tolerance, exact, cache, progress, record=None):
+    validateBattle(game, hit, dmg, crit, hp, followup)
+    if hit[0] == 0 or dmg[0] == 0 or hit[1] == 0 or dmg[1] == 0:
+        # solveBattle() answers these without a table
+        result = AdaptiveResult(_solveBattle(game, hit, dmg, crit, hp, followup, "exact", None, None, False), \
+                                0.0, "exact")
+    else:
+        m, n = hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0])
+        p1, p2 = trueHit(game, hit[0]), trueHit(game, hit[1])
+        c1, c2 = Fraction(crit[0], 100), Fraction(crit[1], 100)
+        bound = float("inf")
+        if not exact and np is not None:
+            bound = floatErrorBound(floatKernel(followup, p1, p2, c1, c2), m, n)
+        if bound <= tolerance:
+            if cache is not None:
+                value = cache.get(followup, m, n, p1, p2, c1, c2, "float", progress).cell(m, n)
+            else:
+                value = DP_window(followup, m, n, p1, p2, c1, c2, "float", progress)
+            result = AdaptiveResult(value, bound, "float")
+        elif cache is not None:
+            result = AdaptiveResult(cache.get(followup, m, n, p1, p2, c1, c2, "integer", progress).cell(m, n), \
+                                    0.0, "exact")
+        else:
+            result = AdaptiveResult(DP_window(followup, m, n, p1, p2, c1, c2, "integer", progress), 0.0, "exact")
+    if record is not None:
+        record.update({"path": result.path, "bound": result.bound})
+    return result
+
+def solveOutcome(game, hit, dmg, crit, hp, followup="Neither", exact=True):
+    """ Returns the BattleOutcome for the given battle, with the same arguments as solveBattle(). A side that
+        can't hit or damage the other never defeats it, as in solveBattle(). Raises InputError if the
+        parameters are invalid. """
+    validateBattle(game, hit, dmg, crit, hp, followup)
+
+    p1, p2 = trueHit(game, hit[0]), trueHit(game, hit[1])
+    c1, c2 = Fraction(crit[0], 100), Fraction(crit[1], 100)
+    # A side that can't damage the other is given a hit rate of 0 and one hit to take, which it never loses
+    if dmg[0] == 0:
+        p1 = Fraction(0)
+    if dmg[1] == 0:
+        p2 = Fraction(0)
+    m = hitsToKill(hp[0], dmg[1]) if p2 > 0 else 1
+    n = hitsToKill(hp[1], dmg[0]) if p1 > 0 else 1
+    return DP_outcome(followup, m, n, p1, p2, c1, c2, exact)
+
+
+###############################################################################
+################################# Arena chains ################################
+###############################################################################
+
+# In the arena the player fights several battles in a row, entering each one with the HP left over from the
+# last. Entering with different HP only changes how many hits the player can take, and a battle the player
+# wins plays out the same whatever that number was, as long as the player never fell: the damage taken before
+# the enemy falls is monotone. So if T is the damage (in hits) the player has taken when the enemy falls in
+# a battle where the player can't fall, the player wins from m hits with k left with probability P(T = m - k).
+# One forward sweep (DP_outcome) from the largest number of hits any entry HP gives yields T for every
+# entry HP at once, instead of one solve per entry HP.
+
+class ChainResult(object):
+    """ Outcome of a chain of battles. cleared[k] is the probability of winning exactly k battles (the chain
+        ends at the first defeat), for k from 0 to the number of battles, and hpAfter[b] maps the player's HP
+        after winning battle b (counting from 0) to the probability of getting there with it. Values are
+        Fractions or floats, depending on how it was solved. """
+    def __init__(self, cleared, hpAfter):
+        self.cleared = cleared
+        self.hpAfter = hpAfter
+
+    def atLeast(self, k):
+        """ Probability of winning at least k battles. """
+        return sum(self.cleared[k:], self.cleared[0] * 0)
+
+def _damageTaken(game, hit, dmg, crit, hp2, followup, m, exact):
+    """ Distribution of the damage T, in hits, that the player has taken when the enemy falls, for T < m,
+        as a dict. The values sum to the victory probability from m hits. """
+    zero = Fraction(0) if exact else 0.0
+    if hit[0] == 0 or dmg[0] == 0:
+        return {}
+    if hit[1] == 0 or dmg[1] == 0:
+        return {0: zero + 1}
+    n = hitsToKill(hp2, dmg[0])
+    outcome = DP_outcome(followup, m, n, trueHit(game, hit[0]), trueHit(game, hit[1]), Fraction(crit[0], 100), \
+                         Fraction(crit[1], 100), exact)
+    return dict((m - k, x) for k, x in outcome.playerRemaining.items())
+
+def solveChain(game, hp, battles, exact=True):
+    """ Solves a chain of battles for a player starting with hp HP. battles is a sequence of
+        (hit, dmg, crit, enemyHP, followup) tuples, with hit, dmg and crit (player, enemy) pairs as in
+        solveBattle(). Returns a ChainResult, in Fractions if exact is True and in floats otherwise. Raises
+        InputError if any battle is invalid. """
+    for hit, dmg, crit, hp2, followup in battles:
+        validateBattle(game, hit, dmg, crit, (hp, hp2), followup)
+
+    zero = Fraction(0) if exact else 0.0
+    # The player's HP on entering the next battle
+    entering = {hp: zero + 1}
+    cleared, hpAfter = [], []
+    for hit, dmg, crit, hp2, followup in battles:
+        m = max([1] + [hitsToKill(h, dmg[1]) for h in entering]) if dmg[1] > 0 else 1
+        damage = _damageTaken(game, hit, dmg, crit, hp2, followup, m, exact)
+        after = {}
+        for h, x in entering.items():
+            survives = hitsToKill(h, dmg[1]) if dmg[1] > 0 else 1
+            for t, y in damage.items():
+                if t < survives:
+                    after[h - t * dmg[1]] = after.get(h - t * dmg[1], zero) + x * y
+        cleared.append(sum(entering.values(), zero) - sum(after.values(), zero))
+        hpAfter.append(after)
+        entering = after
+    cleared.append(sum(entering.values(), zero))
+    return ChainResult(cleared, hpAfter)
+
+
+###############################################################################
+################################## Table API ##################################
+###############################################################################
+
+class BattleTable(object):
+    """ The full DP table for a fixed follow-up setting and fixed hit/crit rates. values[i][j] is the
+        player's victory probability when the player can take i hits and the enemy can take j hits, for
+        0 <= i <= m and 0 <= j <= n. values is a list of lists of Fractions for the exact backend, the scaled
+        integers of integerTable() for the integer backend (cell() converts them, with the scale Q), and an
+        (m+1) x (n+1) float64 array for the float backend. table is the values of a smaller table for the
+        same rates and backend, which is extended. One table answers every HP/Dmg combination that fits
+        inside it, see query(). """
+    def __init__(self, followup, m, n, p1, p2, c1, c2, backend="exact", table=None, progress=None, \
+                 instrument=None):
+        instrument = instrument if instrument is not None else _instrument
+        if instrument is not None and _probe is None:
+            record = {"solve": "BattleTable", "followup": followup, "m": m, "n": n, "backend": backend,
+                      "rates": [str(Fraction(x)) for x in (p1, p2, c1, c2)], "extends": table is not None}
+            instrument.measure(lambda: self._solve(followup, m, n, p1, p2, c1, c2, backend, table, progress), \
+                               record)
+        else:
+            self._solve(followup, m, n, p1, p2, c1, c2, backend, table, progress)
+
+    def _solve(self, followup, m, n, p1, p2, c1, c2, backend, table, progress):
+        self.followup = followup
+        self.p1, self.p2 = Fraction(p1), Fraction(p2)
+        self.c1, self.c2 = Fraction(c1), Fraction(c2)
+        self.backend = backend
+        rates = (self.p1, self.p2, self.c1, self.c2)
+        if backend == "float":
+            self.values = DP_float(followup, m, n, *rates, full=True, table=table, progress=progress)
+        elif backend == "integer":
+            self.Q, self.values = integerTable(followup, m, n, *rates, table=table, progress=progress)
+        elif followup in DP_functions and progress is None:
+            self.values = DP_functions[followup](m, n, *rates, full=True, table=table)
+        else:
+            # DP_round gives the same table, and can report progress
+            self.values = DP_round(followup, m, n, *rates, full=True, table=table, progress=progress)
+        self.m, self.n = len(self.values) - 1, len(self.values[0]) - 1
+        return self
+
+    def extended(self, m, n, progress=None, instrument=None):
+        """ Returns a table covering both this table and (m, n), computing only the new cells. """
+        return BattleTable(self.followup, m, n, self.p1, self.p2, self.c1, self.c2, self.backend, self.values, \
+                           progress, instrument)
+
+    def nbytes(self):
+        """ Approximate memory used by the table values. """
+        if self.backend == "float":
+            return self.values.nbytes
+        size = sys.getsizeof(self.values)
+        for row in self.values:
+            size += sys.getsizeof(row)
+            if self.backend == "integer":
+                size += sum(map(sys.getsizeof, row))
+                continue
+            for x in row:
+                size += sys.getsizeof(x) + sys.getsizeof(x.numerator) + sys.getsizeof(x.denominator)
+        return size
+
+    def cell(self, i, j):
+        """ Victory probability when the player can take i hits and the enemy can take j hits. """
+        if i < 0 or j < 0 or i > self.m or j > self.n:
+            raise IndexError("Cell (%d, %d) is outside the %dx%d table." % (i, j, self.m + 1, self.n + 1))
+        if self.backend == "float":
+            return float(self.values[i][j])
+        if self.backend == "integer":
+            return scaledCell(self.Q, self.values, i, j)
+        return self.values[i][j]
+
+    def query(self, hp1, dmg2, hp2, dmg1):
+        """ Victory probability for the given player HP, enemy Dmg, enemy HP and player Dmg, mapped to a cell
+            with the same ceil logic as solveBattle(). Raises IndexError if the matchup needs more hits than
+            the table holds. """
+        zero, one = (0.0, 1.0) if self.backend == "float" else (Fraction(0), Fraction(1))
+        # If the player can't hit/damage the enemy, then the enemy will win
+        if self.p1 == 0 or dmg1 == 0:
+            return zero
+        # ...and likewise if the enemy can't hit/damage
+        if self.p2 == 0 or dmg2 == 0:
+            return one
+        return self.cell(hitsToKill(hp1, dmg2), hitsToKill(hp2, dmg1))
+
+class TableCache(object):
+    """ In-process LRU cache of BattleTables, keyed by follow-up setting, true hit and crit rates, and backend.
+        A request for a larger table than the cached one extends the cached table instead of solving from
+        scratch. Least recently used tables are evicted once the cached tables take more than maxBytes. """
+    def __init__(self, maxBytes=64 * 2**20):
+        self.maxBytes = maxBytes
+        self.tables = OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.extensions = 0
+        self.evictions = 0
+
+    def get(self, followup, m, n, p1, p2, c1, c2, backend="exact", progress=None):
+        """ Returns a BattleTable for the given rates covering at least (m, n). progress is passed on to the
+            dynamic program if a table has to be solved or extended. """
+        table = self.find(followup, p1, p2, c1, c2, backend)
+        if table is not None and table.m >= m and table.n >= n:
+            self.hits += 1
+            return table
+
+        if table is None:
+            self.misses += 1
+            table = BattleTable(followup, m, n, p1, p2, c1, c2, backend, progress=progress)
+        else:
+            self.extensions += 1
+            table = table.extended(m, n, progress)
+        self.add(table)
+        return table
+
+    def find(self, followup, p1, p2, c1, c2, backend="exact"):
+        """ Returns the cached table for the given rates (of any size), or None. Doesn't touch the counters. """
+        key = (followup, Fraction(p1), Fraction(p2), Fraction(c1), Fraction(c2), backend)
+        table = self.tables.get(key)
+        if table is not None:
+            self.tables[key] = self.tables.pop(key)
+        return table
+
+    def add(self, table, size=None):
+        """ Adds a table to the cache, replacing any smaller table for the same rates, and evicts the least
+            recently used tables if the cache is over its budget. size is table.nbytes(), if the caller
+            already has it (measuring an exact table walks every value). """
+        key = (table.followup, table.p1, table.p2, table.c1, table.c2, table.backend)
+        if key in self.tables:
+            self.bytes -= self.sizes.pop(key)
+            del self.tables[key]
+        self.tables[key] = table
+        self.sizes[key] = table.nbytes() if size is None else size
+        self.bytes += self.sizes[key]
+        while self.bytes > self.maxBytes and self.tables:
+            oldest, _ = self.tables.popitem(last=False)
+            self.bytes -= self.sizes.pop(oldest)
+            self.evictions += 1
+
+    def clear(self):
+        """ Drops every cached table. The counters are kept. """
+        self.tables.clear()
+        self.sizes.clear()
+        self.bytes = 0
+
+    def stats(self):
+        """ Counters for sizing the cache. """
+        return {"hits": self.hits, "misses": self.misses, "extensions": self.extensions,
+                "evictions": self.evictions, "tables": len(self.tables), "bytes": self.bytes,
+                "maxBytes": self.maxBytes}
+
+def battleTable(game, hit, crit, m, n, followup="Neither", backend="exact", cache=None):
+    """ Solves the whole table for the given game, (player, enemy) hit and crit pairs and follow-up
+        setting, up to m hits to defeat the player and n hits to defeat the enemy. If a TableCache is given,
+        the table is taken from (and kept in) the cache, and may be larger than (m, n). Raises InputError if
+        the parameters are invalid. """
+    # Dmg and HP don't enter the table; placeholder values let validateBattle check everything else,
+    # including the endless battle where neither side can hit
+    validateBattle(game, hit, (1, 1), crit, (m, n), followup)
+    if backend not in backends:
+        raise InputError("Selection error", 'Backend must be one of "exact", "float" or "integer".')
+    p1, p2 = trueHit(game, hit[0]), trueHit(game, hit[1])
+    c1, c2 = Fraction(crit[0], 100), Fraction(crit[1], 100)
+    if cache is not None:
+        return cache.get(followup, m, n, p1, p2, c1, c2, backend)
+    return BattleTable(followup, m, n, p1, p2, c1, c2, backend)
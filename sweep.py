@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+
+"""
+sweep.py
+
+Vectorized parameter sweeps. The hit and crit rates only enter the dynamic program as the weights of the
+round kernel, so instead of solving one battle per rate setting, the DP is run once with every weight held
+as an array over the whole grid of rates. Each anti-diagonal of the table is then a (cells, grid points)
+array, and the whole sweep costs about as many NumPy operations as a single float solve.
+
+Any of the four rates (player hit, enemy hit, player crit, enemy crit) can be swept; the result has one
+axis per swept rate, in that order. Dmg and HP are fixed for a sweep. Requires NumPy.
+
+Usage: python sweep.py GAME FOLLOWUP HIT1 HIT2 DMG1 DMG2 CRIT1 CRIT2 HP1 HP2 [-o heatmap.csv | -o heatmap.npy]
+       where each of HIT1, HIT2, CRIT1 and CRIT2 is a rate or a list of rates such as "0-100" or "0-100:5"
+       e.g. python sweep.py Awakening Neither 0-100 75 10 8 0-100 5 30 30 -o heatmap.csv
+"""
+
+import argparse
+import sys
+
+from lookup import parseRates
+from solver import _1RN, _1RN_games, _2RN, _2RN_games, Fates, InputError, floatWindow, hitsToKill, np, \
+                   roundTerm, strikeOrder, strikeOutcomes, strikePaths, validateBattle
+
+# Names of the rates that can be swept, in the order of the result axes
+rateNames = ["hit1", "hit2", "crit1", "crit2"]
+
+
+###############################################################################
+############################## Vectorized program #############################
+###############################################################################
+
+def trueHitArray(game, hits):
+    """ trueHit() for an integer array of displayed hit rates, as float64. """
+    if game in _1RN_games:
+        return np.array(_1RN, dtype=np.float64)[hits] / 100
+    elif game in _2RN_games:
+        return np.array(_2RN, dtype=np.float64)[hits] / 10000
+    return np.array(Fates, dtype=np.float64)[hits] / 10000
+
+def sweepKernel(followup, p1, p2, c1, c2):
+    """ Compiles the round for a follow-up setting or strike order with each rate given as a float array,
+        all of the same shape. Returns a list of (weights, di, dj, cuts) terms as in compileRound(), with
+        weights an array of that shape, and the array of probabilities that a round does nothing. Grid points
+        where every round does nothing get zero weights. Terms that are zero everywhere are dropped. """
+    merged = {}
+    for points, weight in strikePaths(strikeOrder(followup), strikeOutcomes(p1, p2, c1, c2)).items():
+        term = roundTerm(points)
+        merged[term] = merged.get(term, 0) + weight
+
+    stay = merged.pop((0, 0, ()))
+    scale = np.zeros_like(stay)
+    np.divide(1, 1 - stay, out=scale, where=stay < 1)
+    return [(weight * scale, di, dj, cuts) for (di, dj, cuts), weight in sorted(merged.items()) \
+            if np.any(weight != 0)], stay
+
+def DP_sweep(followup, m, n, p1, p2, c1, c2):
+    """ Victory probability DP[m][n] for every grid point at once. p1, p2, c1 and c2 are float arrays of the
+        same shape and so is the result. This is solver.floatWindow() with a grid axis on every cell, so
+        memory is O(m * grid size) rather than O(m * n * grid size). """
+    terms, stay = sweepKernel(followup, p1, p2, c1, c2)
+    terms = [(weight.ravel(), di, dj, cuts) for weight, di, dj, cuts in terms]
+    return floatWindow(terms, m, n, stay.size).reshape(stay.shape)
+
+
+###############################################################################
+################################## Sweep API ##################################
+###############################################################################
+
+def sweep(game, hit, dmg, crit, hp, followup="Neither"):
+    """ Player's victory probability over a grid of rates, as a float64 array. Takes the same arguments as
+        solveBattle(), except that each entry of hit and crit may be a sequence of integer rates instead of
+        a single rate. The result has one axis for each rate given as a sequence, in the order player hit,
+        enemy hit, player crit, enemy crit, so sweep(game, (range(101), 60), dmg, (range(101), 5), hp) has
+        shape (101, 101) and is indexed by [player hit, player crit]. Each value is the one solveBattle()
+        gives with backend "float", or NaN at grid points where neither side can hit, so the battle never
+        ends. Raises InputError if any other grid point is invalid. """
+    if np is None:
+        raise ImportError("Sweeps require NumPy.")
+    rates = []
+    for value in list(hit) + list(crit):
+        values = np.atleast_1d(np.asarray(value))
+        if values.ndim != 1 or values.size == 0 or values.dtype.kind not in "iu":
+            raise InputError("Input error", "Hit and Crit must be whole numbers or lists of whole numbers.")
+        rates.append(values)
+    # Checking the smallest and largest value of each rate covers the whole grid. Grid points where neither
+    # side can hit are only an error if there are no others, so hit rates of 0 are left out of the minimum.
+    h1, h2, k1, k2 = [int(values.max()) for values in rates]
+    validateBattle(game, (h1, h2), dmg, (k1, k2), hp, followup)
+    h1, h2, k1, k2 = [int(values.min()) for values in rates]
+    validateBattle(game, (h1 or 1, h2 or 1), dmg, (k1, k2), hp, followup)
+    swept = [np.ndim(value) > 0 for value in list(hit) + list(crit)]
+
+    # Give each rate its own axis, so they broadcast against each other into the grid
+    grid = [values.reshape([-1 if k == axis else 1 for k in range(4)]) for axis, values in enumerate(rates)]
+    hit1, hit2, crit1, crit2 = np.broadcast_arrays(*grid)
+
+    if dmg[0] > 0 and dmg[1] > 0:
+        m, n = hitsToKill(hp[0], dmg[1]), hitsToKill(hp[1], dmg[0])
+        victory = DP_sweep(followup, m, n, trueHitArray(game, hit1), trueHitArray(game, hit2), \
+                           crit1 / 100.0, crit2 / 100.0)
+    else:
+        victory = np.zeros(hit1.shape)
+    # As in solveBattle(), a side that can't hit/damage the other never wins, and otherwise a side that
+    # can't be hit/damaged does. Where neither can, the battle never ends and the result is NaN.
+    playerHits, enemyHits = (hit1 > 0) & (dmg[0] > 0), (hit2 > 0) & (dmg[1] > 0)
+    victory[~enemyHits] = 1.0
+    victory[~playerHits] = 0.0
+    victory[~playerHits & ~enemyHits] = np.nan
+
+    return victory.reshape([len(values) for values, s in zip(rates, swept) if s])
+
+
+###############################################################################
+############################# Command-line usage ##############################
+###############################################################################
+
+def writeCSV(stream, victory, axes):
+    """ Writes a sweep with at most two swept rates as CSV percentages, with the swept rates labelling the
+        rows and columns. axes lists (name, rates) for each axis of victory. """
+    if victory.ndim > 2:
+        raise ValueError("CSV output needs at most two swept rates; use .npy for %d." % victory.ndim)
+    if victory.ndim == 0:
+        stream.write("percent\n%r\n" % (100 * float(victory)))
+        return
+    (rowName, rowRates), columns = axes[0], axes[1:]
+    if columns:
+        stream.write("%s\\%s," % (rowName, columns[0][0]) + ",".join(str(x) for x in columns[0][1]) + "\n")
+    else:
+        victory = victory[:, None]
+        stream.write("%s,percent\n" % rowName)
+    for rate, values in zip(rowRates, victory):
+        stream.write("%d," % rate + ",".join(repr(100 * float(x)) for x in values) + "\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep the victory probability over grids of hit/crit rates.")
+    parser.add_argument("game")
+    parser.add_argument("followup", help='"Neither", "Player", "Enemy" or a strike order')
+    parser.add_argument("hit1", type=parseRates)
+    parser.add_argument("hit2", type=parseRates)
+    parser.add_argument("dmg1", type=int)
+    parser.add_argument("dmg2", type=int)
+    parser.add_argument("crit1", type=parseRates)
+    parser.add_argument("crit2", type=parseRates)
+    parser.add_argument("hp1", type=int)
+    parser.add_argument("hp2", type=int)
+    parser.add_argument("-o", "--output", default="-",
+                        help='.csv (one or two swept rates) or .npy (any number) file (default "-", CSV to stdout)')
+    args = parser.parse_args(argv)
+
+    values = [args.hit1, args.hit2, args.crit1, args.crit2]
+    # A single rate is held fixed; a list of several is swept
+    rates = [v if len(v) > 1 else v[0] for v in values]
+    axes = [(name, v) for name, v in zip(rateNames, values) if len(v) > 1]
+    if len(axes) > 2 and not args.output.endswith(".npy"):
+        parser.error("CSV output needs at most two swept rates; use a .npy output file for more.")
+    try:
+        victory = sweep(args.game, rates[:2], (args.dmg1, args.dmg2), rates[2:], (args.hp1, args.hp2), \
+                        args.followup)
+    except InputError as e:
+        parser.exit(2, "%s: %s\n" % (e.title, e.message))
+
+    if args.output.endswith(".npy"):
+        np.save(args.output, victory)
+    elif args.output == "-":
+        writeCSV(sys.stdout, victory, axes)
+    else:
+        with open(args.output, "w") as f:
+            writeCSV(f, victory, axes)
+
+if __name__ == "__main__":
+    main()
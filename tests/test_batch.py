@@ -0,0 +1,18 @@
+import json
+
+import batch
+
+
+ROW = {"game": "Awakening", "hit1": 50, "hit2": 60, "dmg1": 5, "dmg2": 5, "crit1": 0, "crit2": 0, "hp1": 20,
+       "hp2": 20}
+
+def test_malformed_line_gets_its_own_error_row(tmp_path):
+    source, output = tmp_path / "matchups.jsonl", tmp_path / "results.jsonl"
+    source.write_text(json.dumps(ROW) + "\n{bad json\n" + json.dumps(dict(ROW, hit1=70)) + "\n")
+    batch.main([str(source), "-o", str(output), "-p", "1"])
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert len(rows) == 3
+    assert rows[0]["error"] == "" and rows[2]["error"] == ""
+    assert rows[1]["error"].startswith("Line 2 is not valid JSON")
+    assert rows[1]["numerator"] == ""
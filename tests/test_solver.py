@@ -0,0 +1,13 @@
+import pytest
+
+from solver import MAX_STRIKES, InputError, solveBattle, validateBattle
+
+
+BATTLE = ("Awakening", (80, 70), (7, 6), (10, 5), (30, 28))
+
+def test_long_strike_order_rejected():
+    validateBattle(*BATTLE, followup="PE" * (MAX_STRIKES // 2))
+    with pytest.raises(InputError):
+        validateBattle(*BATTLE, followup="PE" * 8)
+    with pytest.raises(InputError):
+        solveBattle(*BATTLE, followup="P" * MAX_STRIKES + "E")
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+
+"""
+wavefront.py
+
+Parallel float64 fill for single very large tables. Batch mode spreads many matchups over the cores, but one
+huge matchup is still a single table filled on one core. Here the skewed table of solver.floatTable() lives
+in a shared memory buffer that every worker process maps, and is cut into tiles: a block of anti-diagonals
+by a range of rows. A cell only reads earlier anti-diagonals at the same or lower rows, so tile (a, b), for
+diagonal block a and row range b, only needs tiles (a - 1, b), (a, b - 1) and (a - 1, b - 1). All the tiles
+with the same a + b (a wavefront) are independent and are filled at the same time, one per worker; only
+tile coordinates pass between processes, never table data.
+
+The result is bit-for-bit the one DP_float() gives, since every cell is computed by the same operations in
+the same order. Only the float backend is parallelized: the exact backends' cells are arbitrary-precision
+integers, which can't be placed in a shared buffer. Requires NumPy and Python 3.8+.
+
+Usage: python wavefront.py [--size 4000] [--processes 1,2,4,8] [--tile N] [--followup Neither]
+       prints a scaling curve: the time of a size x size fill for each process count
+"""
+
+import argparse
+import time
+from fractions import Fraction
+from multiprocessing import Pool, cpu_count
+from multiprocessing.shared_memory import SharedMemory
+
+from solver import _fillDiagonal, floatKernel, kernelReach, np, trueHit
+
+
+# The worker's view of the shared table, and what it needs to fill a tile
+_table = None
+
+def _attach(name, shape, terms, pad, m, n):
+    """ Pool initializer: maps the shared table into this worker. """
+    global _table
+    memory = SharedMemory(name=name)
+    _table = (memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf), terms, pad, m, n)
+
+def fillTile(tile):
+    """ Fills the cells of anti-diagonals d0 <= d < d1 and rows i0 <= i < i1. """
+    d0, d1, i0, i1 = tile
+    memory, S, terms, pad, m, n = _table
+    for d in range(d0, d1):
+        lo, hi = max(1, d - n, i0), min(m, d - 1, i1 - 1)
+        if lo <= hi:
+            _fillDiagonal(S, pad, terms, d, lo, hi)
+
+def wavefronts(m, n, rows, diagonals):
+    """ Lists the wavefronts of the tiling, each a list of (d0, d1, i0, i1) tiles that can be filled in
+        parallel. Rows are split into ranges of the given size, and anti-diagonals into blocks. Tiles with no
+        cells in the table are left out. """
+    fronts = {}
+    for b, i0 in enumerate(range(1, m + 1, rows)):
+        i1 = min(m + 1, i0 + rows)
+        for a, d0 in enumerate(range(2, m + n + 1, diagonals)):
+            d1 = min(m + n + 1, d0 + diagonals)
+            # Rows i0 <= i < i1 have cells on anti-diagonals i0 + 1 to i1 - 1 + n
+            if d0 <= i1 - 1 + n and d1 > i0 + 1:
+                fronts.setdefault(a + b, []).append((d0, d1, i0, i1))
+    return [fronts[k] for k in sorted(fronts)]
+
+def DP_parallel(followup, m, n, p1, p2, c1, c2, processes=None, tile=None):
+    """ DP_float(followup, m, n, p1, p2, c1, c2) filled by a pool of processes (all cores by default).
+        tile is the number of rows, and of anti-diagonals, in a tile; by default the rows are split into four
+        ranges per process, so a wavefront has enough tiles to keep every process busy. """
+    global _table
+    if np is None:
+        raise ImportError("The parallel fill requires NumPy.")
+    processes = processes or cpu_count()
+    terms = floatKernel(followup, p1, p2, c1, c2)
+    pad = kernelReach(terms)
+    if m == 0 or n == 0:
+        return float(n == 0)
+    tile = max(pad, tile or -(-m // (4 * processes)))
+
+    shape = (m + n + 2*pad + 1, m + pad + 1)
+    memory = SharedMemory(create=True, size=shape[0] * shape[1] * 8)
+    try:
+        S = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+        # The same padding as floatTable(), written a row of the skewed table at a time
+        cols = np.arange(m + pad + 1) - pad
+        for row in range(shape[0]):
+            S[row] = (row - 2*pad - cols <= 0)
+
+        fronts = wavefronts(m, n, tile, tile)
+        if processes == 1:
+            _attach(memory.name, shape, terms, pad, m, n)
+            for front in fronts:
+                for t in front:
+                    fillTile(t)
+        else:
+            pool = Pool(processes, _attach, (memory.name, shape, terms, pad, m, n))
+            try:
+                for front in fronts:
+                    pool.map(fillTile, front, chunksize=1)
+            finally:
+                pool.terminate()
+        result = float(S[m + n + 2*pad, m + pad])
+        del S
+    finally:
+        if _table is not None and _table[0].name == memory.name:
+            _table[0].close()
+            _table = None
+        memory.close()
+        memory.unlink()
+    return result
+
+
+###############################################################################
+############################# Command-line usage ##############################
+###############################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the parallel float fill for 1 to N processes.")
+    parser.add_argument("--size", type=int, default=4000, help="hits on each side (default 4000)")
+    parser.add_argument("--processes", default=None,
+                        help="comma-separated process counts (default: 1, 2, 4, ... up to the core count)")
+    parser.add_argument("--tile", type=int, default=None, help="rows and anti-diagonals per tile")
+    parser.add_argument("--followup", default="Neither")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    args = parser.parse_args(argv)
+
+    if args.processes:
+        counts = [int(x) for x in args.processes.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= cpu_count():
+            counts.append(counts[-1] * 2)
+    rates = (args.followup, args.size, args.size, trueHit("Awakening", 80), trueHit("Awakening", 75), \
+             Fraction(10, 100), Fraction(5, 100))
+
+    print("%d cores, %dx%d table, %s" % (cpu_count(), args.size, args.size, args.followup))
+    print("processes  seconds  speedup  efficiency")
+    base = None
+    for count in counts:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            DP_parallel(*rates, processes=count, tile=args.tile)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        base = base or best * counts[0]
+        print("%9d  %7.3f  %7.2f  %9.0f%%" % (count, best, base / best, 100 * base / best / count))
+
+if __name__ == "__main__":
+    main()